@@ -7,21 +7,49 @@ import os
 import sys
 import shutil
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatch
 from pathlib import Path
 
+# Binaries UPX breaks or that refuse to load once packed: the MSVC/UCRT
+# runtime and API sets, CFG-guarded DLLs (python, onnxruntime) and the
+# large native stacks (torch, Qt). Patterns match any path component, so
+# "torch*" covers everything under torch/lib too.
+UPX_EXCLUDE = [
+    "vcruntime*.dll",
+    "msvcp*.dll",
+    "ucrtbase.dll",
+    "api-ms-win-*.dll",
+    "python3*.dll",
+    "onnxruntime*",
+    "torch*",
+    "*qt*",
+]
+
+# A packed exe that loads its DLLs stays up; a broken one exits at once
+SMOKE_TEST_SECONDS = 15
+
+# Frontend assets the backend serves precompressed (see CompressedStaticFiles)
+PRECOMPRESS_PATTERNS = ["*.js", "*.css", "*.svg", "*.json", "*.map"]
+
 def run_command(cmd, cwd=None):
-    """Run a command and return success status"""
+    """Run a command, streaming its output, and return success status"""
     print(f"Running: {cmd}")
     try:
-        result = subprocess.run(cmd, shell=True, check=True, cwd=cwd, 
-                              capture_output=True, text=True)
-        print(result.stdout)
-        return True
-    except subprocess.CalledProcessError as e:
+        process = subprocess.Popen(cmd, shell=True, cwd=cwd,
+                                   stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                   text=True, bufsize=1)
+        for line in process.stdout:
+            print(line, end="")
+        process.wait()
+    except OSError as e:
         print(f"Error: {e}")
-        print(f"Stdout: {e.stdout}")
-        print(f"Stderr: {e.stderr}")
         return False
+    
+    if process.returncode != 0:
+        print(f"Error: Command '{cmd}' returned non-zero exit status {process.returncode}.")
+        return False
+    return True
 
 def build_frontend():
     """Build the React frontend"""
@@ -40,6 +68,36 @@ def build_frontend():
     if not run_command("npm run build", cwd=frontend_dir):
         return False
     
+    # Vite's outDir is build/, with the hashed bundles under build/assets
+    return precompress_static(frontend_dir / "build" / "assets")
+
+def precompress_static(static_dir):
+    """Write .br and .zst siblings for static assets in parallel, with whichever tools are installed"""
+    commands = []
+    brotli = shutil.which("brotli")
+    if brotli:
+        commands.append(lambda path: [brotli, "-q", "11", "-k", "-f", str(path)])
+    zstd = shutil.which("zstd")
+    if zstd:
+        commands.append(lambda path: [zstd, "-19", "-k", "-f", "-q", str(path)])
+    if not commands:
+        print("brotli/zstd not found, skipping static asset precompression")
+        return True
+    
+    assets = [path for pattern in PRECOMPRESS_PATTERNS for path in static_dir.rglob(pattern)]
+    
+    def compress(args):
+        result = subprocess.run(args, capture_output=True, text=True)
+        return args[-1], result.returncode, result.stderr
+    
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        jobs = [command(path) for path in assets for command in commands]
+        for path, returncode, stderr in executor.map(compress, jobs):
+            if returncode != 0:
+                print(f"Precompression failed for {path}: {stderr.strip()}")
+                return False
+    
+    print(f"Precompressed {len(assets)} static assets")
     return True
 
 def create_pyinstaller_spec():
@@ -98,7 +156,7 @@ exe = EXE(
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
+    upx=False,
     console=False,
     disable_windowed_traceback=False,
     argv_emulation=False,
@@ -113,7 +171,7 @@ coll = COLLECT(
     a.zipfiles,
     a.datas,
     strip=False,
-    upx=True,
+    upx=False,
     upx_exclude=[],
     name='PersonalFinanceAgent',
 )
@@ -136,8 +194,69 @@ def build_executable():
     if not run_command("pyinstaller PersonalFinanceAgent.spec --clean"):
         return False
     
+    dist_dir = Path("dist/PersonalFinanceAgent")
+    compress_binaries(dist_dir)
+    
+    return smoke_test_executable(dist_dir / "PersonalFinanceAgent.exe")
+
+def compress_binaries(dist_dir):
+    """Compress collected binaries with UPX in parallel, if UPX is installed"""
+    upx = shutil.which("upx")
+    if not upx:
+        print("UPX not found, skipping binary compression")
+        return True
+    
+    binaries = [
+        path for pattern in ("*.dll", "*.pyd", "*.exe")
+        for path in dist_dir.rglob(pattern)
+        if not any(
+            fnmatch(part.lower(), exclude)
+            for part in path.relative_to(dist_dir).parts
+            for exclude in UPX_EXCLUDE
+        )
+    ]
+    
+    def compress(path):
+        result = subprocess.run([upx, "--best", "-q", str(path)], capture_output=True, text=True)
+        return path, result.returncode, result.stderr
+    
+    # PyInstaller runs UPX one file at a time; each upx call is its own process,
+    # so a thread pool is enough to keep every core busy
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        for path, returncode, stderr in executor.map(compress, binaries):
+            # Files UPX cannot pack are left as they are
+            if returncode != 0:
+                print(f"UPX skipped {path}: {stderr.strip()}")
+    
+    print(f"Compressed {len(binaries)} binaries with UPX")
     return True
 
+def smoke_test_executable(exe_path):
+    """Launch the packed executable and make sure it doesn't die on startup"""
+    if not exe_path.is_file():
+        print(f"Smoke test failed: {exe_path} was not produced by the build")
+        return False
+    
+    print(f"Smoke testing {exe_path}...")
+    try:
+        process = subprocess.Popen([str(exe_path)], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    except OSError as e:
+        # e.g. a Windows executable on a non-Windows build host
+        print(f"Smoke test failed: could not launch {exe_path}: {e}")
+        return False
+    try:
+        process.wait(timeout=SMOKE_TEST_SECONDS)
+    except subprocess.TimeoutExpired:
+        # Still running: the tray app started normally
+        process.kill()
+        process.wait()
+        print("Smoke test passed")
+        return True
+    
+    output = process.stdout.read().decode(errors="replace")
+    print(f"Packed executable exited with code {process.returncode}:\n{output}")
+    return False
+
 def create_inno_setup_script():
     """Create Inno Setup script"""
     script_content = '''
@@ -1,39 +1,109 @@
 import asyncio
-import json
+import itertools
+import re
 import subprocess
+import sys
 from pathlib import Path
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, AsyncIterator, Iterator, Tuple
 from datetime import datetime
 
+from . import json_utils
 from .llm_client import LLMClient
 
+# Document types in priority order with the phrases that identify them
+DOCUMENT_TYPE_PATTERNS = [
+    ("credit_card", [
+        'credit card', 'statement balance', 'minimum payment', 'payment due',
+        'available credit', 'credit limit', 'annual percentage rate'
+    ]),
+    ("bank_statement", [
+        'checking account', 'savings account', 'account balance',
+        'deposits', 'withdrawals', 'opening balance', 'closing balance'
+    ]),
+    ("investment", [
+        'portfolio', 'securities', 'dividend', 'capital gains',
+        'mutual fund', 'stock', 'bond', 'investment account'
+    ]),
+    ("tax_document", [
+        'form 1040', 'tax return', 'w-2', '1099', 'irs',
+        'adjusted gross income', 'taxable income'
+    ]),
+    ("insurance", [
+        'insurance', 'policy', 'premium', 'deductible',
+        'coverage', 'claim'
+    ]),
+    ("loan", [
+        'mortgage', 'loan', 'principal', 'interest rate',
+        'monthly payment', 'balance remaining'
+    ]),
+]
+
+# Replies carry whole-document text on a single line, far past asyncio's 64 KiB default
+MCP_STREAM_LIMIT = 64 * 1024 * 1024
+MCP_RESPONSE_TIMEOUT = 120
+
+DOCUMENT_TYPES = {document_type for document_type, _ in DOCUMENT_TYPE_PATTERNS} | {"other"}
+
+# Statements identify themselves in the header, so only the start is classified
+CLASSIFICATION_WINDOW = 8192
+
+# Pages extracted per worker-thread call when iterating a document page by page
+PAGE_BATCH_SIZE = 16
+
+_PATTERN_PRIORITY: Dict[str, int] = {
+    pattern: priority
+    for priority, (_, patterns) in enumerate(DOCUMENT_TYPE_PATTERNS)
+    for pattern in patterns
+}
+
+# Zero-width lookahead reports every keyword occurrence, including overlapping
+# ones, and alternatives are ordered by priority so the best type wins ties
+_DOCUMENT_TYPE_REGEX = re.compile(
+    "(?=(" + "|".join(re.escape(pattern) for pattern in _PATTERN_PRIORITY) + "))"
+)
+
 class DocumentProcessor:
-    def __init__(self):
+    def __init__(self, use_mcp: bool = False):
         self.supported_formats = ['.pdf']
+        # Extraction runs in-process by default; the MCP server is opt-in
+        self.use_mcp = use_mcp
+        self._mcp_proc: Optional[asyncio.subprocess.Process] = None
+        self._mcp_lock: Optional[asyncio.Lock] = None
+        self._next_id = 0
         
-    async def process_document(self, file_path: str, llm_client: Optional[LLMClient] = None) -> Dict[str, Any]:
+    async def process_document(self, file_path: str, llm_client: Optional[LLMClient] = None,
+                               hint: Optional[str] = None) -> Dict[str, Any]:
         """
-        Process a financial document and extract relevant information
+        Process a financial document and extract relevant information.
+        A known document type passed as hint skips classification.
         """
-        if not Path(file_path).exists():
+        path = Path(file_path)
+        # stat() can be slow on network drives, so keep it off the event loop
+        if not await asyncio.to_thread(path.exists):
             return {"error": "File not found", "success": False}
         
-        file_extension = Path(file_path).suffix.lower()
+        file_extension = path.suffix.lower()
         if file_extension not in self.supported_formats:
             return {"error": f"Unsupported file format: {file_extension}", "success": False}
         
         try:
-            # Extract text using MCP PDF server
-            text_content = await self._extract_text_via_mcp(file_path)
+            # Extract text in a worker thread, or via the MCP PDF server when enabled
+            if self.use_mcp:
+                text_content = await self._extract_text_via_mcp(file_path)
+            else:
+                text_content = await self._extract_text_direct(file_path)
             if not text_content:
                 return {"error": "Failed to extract text from PDF", "success": False}
             
             # Determine document type
-            document_type = self._classify_document_type(text_content)
+            if hint in DOCUMENT_TYPES:
+                document_type = hint
+            else:
+                document_type = self._classify_document_type(text_content)
             
             result = {
                 "file_path": file_path,
-                "file_name": Path(file_path).name,
+                "file_name": path.name,
                 "document_type": document_type,
                 "extracted_text": text_content,
                 "processing_timestamp": datetime.now().isoformat(),
@@ -62,43 +132,20 @@ class DocumentProcessor:
         Extract text using the MCP PDF processing server
         """
         try:
-            # Start MCP server as subprocess
-            process = await asyncio.create_subprocess_exec(
-                "python", "-m", "src.mcp.pdf_server",
-                stdin=asyncio.subprocess.PIPE,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            
-            # Prepare MCP request
-            request = {
-                "jsonrpc": "2.0",
-                "id": 1,
-                "method": "tools/call",
-                "params": {
-                    "name": "extract_text",
-                    "arguments": {
-                        "file_path": file_path,
-                        "method": "both"
-                    }
+            response = await self._mcp_call("tools/call", {
+                "name": "extract_text",
+                "arguments": {
+                    "file_path": file_path,
+                    "method": "pymupdf"
                 }
-            }
+            })
             
-            # Send request
-            request_json = json.dumps(request) + "\n"
-            stdout, stderr = await process.communicate(request_json.encode())
-            
-            if process.returncode == 0:
-                response = json.loads(stdout.decode())
-                if "result" in response and "content" in response["result"]:
-                    content = response["result"]["content"][0]["text"]
-                    extraction_results = json.loads(content)
-                    
-                    # Prefer pdfplumber result, fallback to pymupdf
-                    if "pdfplumber" in extraction_results:
-                        return extraction_results["pdfplumber"]
-                    elif "pymupdf" in extraction_results:
-                        return extraction_results["pymupdf"]
+            if "result" in response and "content" in response["result"]:
+                content = response["result"]["content"][0]["text"]
+                extraction_results = json_utils.loads(content)
+                
+                if "pymupdf" in extraction_results:
+                    return extraction_results["pymupdf"]
             
             return None
             
@@ -107,92 +154,161 @@ class DocumentProcessor:
             # Fallback to direct extraction
             return await self._extract_text_direct(file_path)
     
-    async def _extract_text_direct(self, file_path: str) -> Optional[str]:
+    def _get_mcp_lock(self) -> asyncio.Lock:
+        # Created lazily so the lock binds to the loop that actually serves requests
+        if self._mcp_lock is None:
+            self._mcp_lock = asyncio.Lock()
+        return self._mcp_lock
+    
+    async def _mcp_call(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
         """
-        Fallback text extraction using direct library calls
+        Send a JSON-RPC request to the long-lived MCP PDF server and wait for its reply
         """
-        try:
-            import PyMuPDF as fitz
+        async with self._get_mcp_lock():
+            if self._mcp_proc is None or self._mcp_proc.returncode is not None:
+                # Spawn the server once and reuse it for every subsequent document
+                self._mcp_proc = await asyncio.create_subprocess_exec(
+                    sys.executable, "-m", "src.mcp.pdf_server",
+                    stdin=asyncio.subprocess.PIPE,
+                    stdout=asyncio.subprocess.PIPE,
+                    limit=MCP_STREAM_LIMIT
+                )
             
-            doc = fitz.open(file_path)
-            text = ""
-            for page_num in range(doc.page_count):
-                page = doc.load_page(page_num)
-                text += f"\n--- Page {page_num + 1} ---\n"
-                text += page.get_text()
-            doc.close()
-            
-            return text
+            self._next_id += 1
+            request = {
+                "jsonrpc": "2.0",
+                "id": self._next_id,
+                "method": method,
+                "params": params
+            }
             
-        except ImportError:
             try:
-                import pdfplumber
+                # Line-delimited framing keeps stdin open between requests
+                self._mcp_proc.stdin.write(json_utils.dumps(request) + b"\n")
+                await self._mcp_proc.stdin.drain()
                 
-                with pdfplumber.open(file_path) as pdf:
-                    text = ""
-                    for page_num, page in enumerate(pdf.pages):
-                        text += f"\n--- Page {page_num + 1} ---\n"
-                        page_text = page.extract_text()
-                        if page_text:
-                            text += page_text
-                
-                return text
-                
-            except ImportError:
-                return None
+                while True:
+                    line = await asyncio.wait_for(self._mcp_proc.stdout.readline(), timeout=MCP_RESPONSE_TIMEOUT)
+                    if not line:
+                        raise RuntimeError("MCP PDF server exited unexpectedly")
+                    response = json_utils.loads(line)
+                    # Skip notifications and anything not addressed to this request
+                    if response.get("id") == request["id"]:
+                        return response
+            except (Exception, asyncio.CancelledError):
+                # The stream may be left mid-message; start a fresh server next time
+                await self._kill_mcp_proc()
+                raise
+    
+    async def _kill_mcp_proc(self):
+        if self._mcp_proc is not None and self._mcp_proc.returncode is None:
+            try:
+                self._mcp_proc.kill()
+            except ProcessLookupError:
+                pass
+            await self._mcp_proc.wait()
+        self._mcp_proc = None
+    
+    async def close(self):
+        """
+        Shut down the MCP PDF server if it is running
+        """
+        async with self._get_mcp_lock():
+            if self._mcp_proc is not None and self._mcp_proc.returncode is None:
+                self._mcp_proc.stdin.close()
+                try:
+                    await asyncio.wait_for(self._mcp_proc.wait(), timeout=5)
+                except asyncio.TimeoutError:
+                    self._mcp_proc.terminate()
+                    await self._mcp_proc.wait()
+            self._mcp_proc = None
+    
+    async def _extract_text_direct(self, file_path: str) -> Optional[str]:
+        """
+        Extract text in-process without blocking the event loop
+        """
+        try:
+            # The whole document in one worker call; a thread hop per page adds up
+            return await asyncio.to_thread(self._extract_text_sync, file_path)
+            
+        except ImportError:
+            return None
         except Exception as e:
             print(f"Direct extraction error: {e}")
             return None
     
+    def _extract_text_sync(self, file_path: str) -> str:
+        parts = []
+        for page_num, page_text in self._page_texts(file_path):
+            parts.append(f"\n--- Page {page_num + 1} ---\n")
+            parts.append(page_text)
+        return "".join(parts)
+    
+    async def _iter_pages(self, file_path: str) -> AsyncIterator[Tuple[int, str]]:
+        """
+        Yield (page_num, page_text) for callers that process pages as they
+        arrive, extracting PAGE_BATCH_SIZE pages per worker-thread call
+        """
+        pages = self._page_texts(file_path)
+        try:
+            while True:
+                batch = await asyncio.to_thread(list, itertools.islice(pages, PAGE_BATCH_SIZE))
+                if not batch:
+                    break
+                for page in batch:
+                    yield page
+        finally:
+            pages.close()
+    
+    def _page_texts(self, file_path: str) -> Iterator[Tuple[int, str]]:
+        """
+        Blocking generator of (page_num, page_text), with PyMuPDF when available
+        and pdfplumber otherwise
+        """
+        try:
+            import fitz
+        except ImportError:
+            fitz = None
+        
+        if fitz is not None:
+            with fitz.open(file_path) as doc:
+                for page_num in range(doc.page_count):
+                    yield page_num, self._pymupdf_page_text(doc, page_num)
+            return
+        
+        import pdfplumber
+        
+        with pdfplumber.open(file_path) as pdf:
+            for page_num, page in enumerate(pdf.pages):
+                page_text = page.extract_text()
+                page.flush_cache()
+                yield page_num, page_text or ""
+    
+    @staticmethod
+    def _pymupdf_page_text(doc, page_num: int) -> str:
+        import fitz
+        
+        page = doc.load_page(page_num)
+        return page.get_textpage(flags=fitz.TEXTFLAGS_TEXT & ~fitz.TEXT_PRESERVE_IMAGES).extractText()
+    
     def _classify_document_type(self, text_content: str) -> str:
         """
         Classify document type based on text content patterns
         """
-        text_lower = text_content.lower()
-        
-        # Credit card patterns
-        if any(pattern in text_lower for pattern in [
-            'credit card', 'statement balance', 'minimum payment', 'payment due',
-            'available credit', 'credit limit', 'annual percentage rate'
-        ]):
-            return "credit_card"
-        
-        # Bank statement patterns
-        if any(pattern in text_lower for pattern in [
-            'checking account', 'savings account', 'account balance',
-            'deposits', 'withdrawals', 'opening balance', 'closing balance'
-        ]):
-            return "bank_statement"
-        
-        # Investment patterns
-        if any(pattern in text_lower for pattern in [
-            'portfolio', 'securities', 'dividend', 'capital gains',
-            'mutual fund', 'stock', 'bond', 'investment account'
-        ]):
-            return "investment"
-        
-        # Tax document patterns
-        if any(pattern in text_lower for pattern in [
-            'form 1040', 'tax return', 'w-2', '1099', 'irs',
-            'adjusted gross income', 'taxable income'
-        ]):
-            return "tax_document"
-        
-        # Insurance patterns
-        if any(pattern in text_lower for pattern in [
-            'insurance', 'policy', 'premium', 'deductible',
-            'coverage', 'claim'
-        ]):
-            return "insurance"
-        
-        # Loan/mortgage patterns
-        if any(pattern in text_lower for pattern in [
-            'mortgage', 'loan', 'principal', 'interest rate',
-            'monthly payment', 'balance remaining'
-        ]):
-            return "loan"
-        
-        return "other"
+        text_lower = text_content[:CLASSIFICATION_WINDOW].lower()
+        
+        # Single scan over the text; earlier entries in DOCUMENT_TYPE_PATTERNS win
+        best_priority = None
+        for match in _DOCUMENT_TYPE_REGEX.finditer(text_lower):
+            priority = _PATTERN_PRIORITY[match.group(1)]
+            if best_priority is None or priority < best_priority:
+                best_priority = priority
+                if priority == 0:
+                    break
+        
+        if best_priority is None:
+            return "other"
+        return DOCUMENT_TYPE_PATTERNS[best_priority][0]
     
     def get_document_insights(self, analysis_result: Dict[str, Any]) -> List[str]:
         """
@@ -218,17 +334,23 @@ class DocumentProcessor:
             transaction_count = len(ai_analysis["transactions"])
             insights.append(f"{transaction_count} transactions processed")
             
-            # Find largest transactions
+            # Find largest transactions in a single pass
             transactions = ai_analysis["transactions"]
             if transactions:
-                largest_expense = min(transactions, key=lambda x: x.get("amount", 0))
-                largest_income = max(transactions, key=lambda x: x.get("amount", 0))
+                largest_expense = largest_income = transactions[0]
+                expense_amount = income_amount = largest_expense.get("amount", 0)
+                for txn in transactions[1:]:
+                    amount = txn.get("amount", 0)
+                    if amount < expense_amount:
+                        largest_expense, expense_amount = txn, amount
+                    elif amount > income_amount:
+                        largest_income, income_amount = txn, amount
                 
-                if largest_expense.get("amount", 0) < -100:
-                    insights.append(f"Largest expense: ${abs(largest_expense['amount']):,.2f} - {largest_expense.get('description', 'Unknown')}")
+                if expense_amount < -100:
+                    insights.append(f"Largest expense: ${abs(expense_amount):,.2f} - {largest_expense.get('description', 'Unknown')}")
                 
-                if largest_income.get("amount", 0) > 100:
-                    insights.append(f"Largest income: ${largest_income['amount']:,.2f} - {largest_income.get('description', 'Unknown')}")
+                if income_amount > 100:
+                    insights.append(f"Largest income: ${income_amount:,.2f} - {largest_income.get('description', 'Unknown')}")
         
         if "investments" in ai_analysis and ai_analysis["investments"]:
             total_investment_value = sum(inv.get("value", 0) for inv in ai_analysis["investments"])
@@ -1,37 +1,90 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func, desc
+from sqlalchemy import func, desc, case
 from typing import Dict, Any, List, Optional
 from datetime import datetime, timedelta
+import copy
 import json
+import time
 
 from ..ui.backend.models import FinancialProfile, Document
 
+EXPENSE_CATEGORIES = ["expenses", "food", "gas", "shopping", "entertainment"]
+ASSET_CATEGORIES = ["assets", "investments"]
+
+_CATEGORY_MAP = {
+    "food": "expenses",
+    "gas": "expenses",
+    "shopping": "expenses",
+    "entertainment": "expenses",
+    "income": "income",
+    "salary": "income",
+    "investment": "investments",
+    "stock": "investments",
+    "bond": "investments",
+    "credit": "liabilities",
+    "loan": "liabilities",
+    "mortgage": "liabilities"
+}
+
+# Managers are created per request, so the summary cache lives at module level.
+# It is keyed by a counter bumped on every write made through a manager plus
+# (max id, row count) for writes made elsewhere; the TTL bounds staleness of
+# the rolling 3-month averages and of anything the key can't see.
+SUMMARY_CACHE_TTL = 60
+_summary_cache: Dict[Any, Any] = {}
+_profile_writes = 0
+
+def _record_profile_write():
+    global _profile_writes
+    _profile_writes += 1
+
+def _optional_str(value: Any) -> Optional[str]:
+    return None if value is None else str(value)
+
 class FinanceProfileManager:
     def __init__(self, db: Session):
         self.db = db
     
     def add_financial_entry(self, category: str, subcategory: str, amount: float, 
                            date: datetime, description: str, source_document_id: int,
-                           metadata: Optional[Dict[str, Any]] = None) -> FinancialProfile:
+                           metadata: Optional[Dict[str, Any]] = None,
+                           symbol: Optional[str] = None) -> FinancialProfile:
         """
         Add a new financial entry to the profile
         """
-        entry = FinancialProfile(
-            category=category,
-            subcategory=subcategory,
-            amount=amount,
-            date=date,
-            description=description,
-            source_document_id=source_document_id,
-            metadata=json.dumps(metadata) if metadata else None
-        )
+        entry = self._build_entry(category, subcategory, amount, date, description,
+                                  source_document_id, metadata, symbol)
         
         self.db.add(entry)
         self.db.commit()
+        _record_profile_write()
         self.db.refresh(entry)
         
         return entry
     
+    def _build_entry(self, category: str, subcategory: str, amount: float, 
+                     date: datetime, description: str, source_document_id: int,
+                     metadata: Optional[Dict[str, Any]] = None,
+                     symbol: Optional[str] = None) -> FinancialProfile:
+        """
+        Construct a financial entry without adding it to the session. LLM output
+        is coerced to the column types here, so a malformed row raises before it
+        can fail the commit for every other entry of its document.
+        """
+        if not isinstance(date, datetime):
+            raise TypeError(f"Entry date must be a datetime, got {type(date).__name__}")
+        
+        return FinancialProfile(
+            category=str(category),
+            subcategory=_optional_str(subcategory),
+            amount=float(amount),
+            date=date,
+            description=_optional_str(description),
+            source_document_id=int(source_document_id),
+            extra_metadata=json.dumps(metadata) if metadata else None,
+            symbol=_optional_str(symbol)
+        )
+    
     def process_document_analysis(self, document_id: int, analysis: Dict[str, Any]):
         """
         Process AI analysis results and create financial profile entries
@@ -40,14 +93,17 @@ class FinanceProfileManager:
             return
         
         ai_analysis = analysis["ai_analysis"]
+        entries = []
         
         # Process transactions
         if "transactions" in ai_analysis:
             for txn in ai_analysis["transactions"]:
+                if not isinstance(txn, dict):
+                    continue
                 try:
                     date = datetime.fromisoformat(txn["date"]) if txn.get("date") else datetime.now()
                     
-                    self.add_financial_entry(
+                    entries.append(self._build_entry(
                         category=self._map_category(txn.get("category", "other")),
                         subcategory=txn.get("type", "unknown"),
                         amount=float(txn.get("amount", 0)),
@@ -55,71 +111,143 @@ class FinanceProfileManager:
                         description=txn.get("description", ""),
                         source_document_id=document_id,
                         metadata={"transaction_type": txn.get("type"), "original_category": txn.get("category")}
-                    )
-                except Exception as e:
+                    ))
+                except (AttributeError, TypeError, ValueError) as e:
                     print(f"Error processing transaction: {e}")
         
         # Process investments
         if "investments" in ai_analysis:
             for inv in ai_analysis["investments"]:
+                if not isinstance(inv, dict):
+                    continue
                 try:
-                    self.add_financial_entry(
+                    entries.append(self._build_entry(
                         category="investments",
                         subcategory=inv.get("type", "unknown"),
                         amount=float(inv.get("value", 0)),
                         date=datetime.now(),
                         description=f"{inv.get('symbol')} - {inv.get('shares', 0)} shares",
                         source_document_id=document_id,
-                        metadata={"symbol": inv.get("symbol"), "shares": inv.get("shares"), "price": inv.get("price")}
-                    )
-                except Exception as e:
+                        metadata={"symbol": inv.get("symbol"), "shares": inv.get("shares"), "price": inv.get("price")},
+                        symbol=inv.get("symbol")
+                    ))
+                except (AttributeError, TypeError, ValueError) as e:
                     print(f"Error processing investment: {e}")
+        
+        if not entries:
+            return
+        
+        # One transaction for the whole document instead of a commit per row
+        try:
+            self.db.add_all(entries)
+            self.db.commit()
+            _record_profile_write()
+        except Exception as e:
+            self.db.rollback()
+            print(f"Error saving financial entries: {e}")
     
     def get_profile_summary(self) -> Dict[str, Any]:
         """
         Generate comprehensive financial profile summary
         """
-        # Calculate totals by category
-        income_total = self.db.query(func.sum(FinancialProfile.amount)).filter(
-            FinancialProfile.category == "income",
-            FinancialProfile.amount > 0
-        ).scalar() or 0.0
+        cache_key = (_profile_writes,) + tuple(self.db.query(
+            func.max(FinancialProfile.id),
+            func.count(FinancialProfile.id)
+        ).one())
+        cached = _summary_cache.get(cache_key)
+        if cached and time.monotonic() - cached[0] < SUMMARY_CACHE_TTL:
+            return copy.deepcopy(cached[1])
         
-        expense_total = abs(self.db.query(func.sum(FinancialProfile.amount)).filter(
-            FinancialProfile.category.in_(["expenses", "food", "gas", "shopping", "entertainment"]),
-            FinancialProfile.amount < 0
-        ).scalar() or 0.0)
+        totals = self._get_totals()
+        
+        summary = {
+            "total_assets": totals["total_assets"],
+            "total_liabilities": totals["total_liabilities"],
+            "net_worth": totals["total_assets"] - totals["total_liabilities"],
+            "monthly_income": totals["monthly_income"],
+            "monthly_expenses": totals["monthly_expenses"],
+            "investment_portfolio": self._get_investment_portfolio(),
+            "credit_accounts": self._get_credit_accounts(),
+            "recent_transactions": self._get_recent_transactions(20),
+            "last_updated": datetime.now().isoformat()
+        }
         
-        asset_total = self.db.query(func.sum(FinancialProfile.amount)).filter(
-            FinancialProfile.category.in_(["assets", "investments"]),
-            FinancialProfile.amount > 0
-        ).scalar() or 0.0
+        _summary_cache.clear()
+        _summary_cache[cache_key] = (time.monotonic(), copy.deepcopy(summary))
         
-        liability_total = abs(self.db.query(func.sum(FinancialProfile.amount)).filter(
-            FinancialProfile.category == "liabilities",
-            FinancialProfile.amount < 0
-        ).scalar() or 0.0)
+        return summary
+    
+    def get_chat_context(self) -> Dict[str, Any]:
+        """
+        Get financial context for chat interactions
+        """
+        totals = self._get_totals()
         
-        # Get investment portfolio
-        investment_portfolio = {}
-        investments = self.db.query(FinancialProfile).filter(
-            FinancialProfile.category == "investments"
-        ).all()
+        # Simplified context for chat
+        return {
+            "net_worth": totals["total_assets"] - totals["total_liabilities"],
+            "monthly_income": totals["monthly_income"],
+            "monthly_expenses": totals["monthly_expenses"],
+            "investment_portfolio": self._get_investment_portfolio(),
+            "recent_transactions": self._get_recent_transactions(5)  # Last 5 transactions
+        }
+    
+    def _get_totals(self) -> Dict[str, float]:
+        """
+        Calculate asset, liability and 3-month average income/expense totals
+        """
+        three_months_ago = datetime.now() - timedelta(days=90)
         
-        for inv in investments:
-            if inv.metadata:
-                try:
-                    metadata = json.loads(inv.metadata)
-                    symbol = metadata.get("symbol")
-                    if symbol:
-                        investment_portfolio[symbol] = investment_portfolio.get(symbol, 0) + inv.amount
-                except:
-                    pass
-        
-        # Get recent transactions
+        # One grouped pass yields all-time and last-3-month sums per category and sign
+        sign = case((FinancialProfile.amount > 0, 1), else_=-1)
+        rows = self.db.query(
+            FinancialProfile.category,
+            sign,
+            func.sum(FinancialProfile.amount),
+            func.sum(case((FinancialProfile.date >= three_months_ago, FinancialProfile.amount), else_=0.0))
+        ).filter(
+            FinancialProfile.amount != 0
+        ).group_by(FinancialProfile.category, sign).all()
+        
+        totals = {}
+        recent_totals = {}
+        for category, amount_sign, total, recent_total in rows:
+            totals[(category, amount_sign)] = total or 0.0
+            recent_totals[(category, amount_sign)] = recent_total or 0.0
+        
+        # Calculate monthly averages (last 3 months)
+        monthly_income = recent_totals.get(("income", 1), 0.0) / 3
+        monthly_expenses = abs(sum(recent_totals.get((category, -1), 0.0) for category in EXPENSE_CATEGORIES)) / 3
+        
+        return {
+            "total_assets": sum(totals.get((category, 1), 0.0) for category in ASSET_CATEGORIES),
+            "total_liabilities": abs(totals.get(("liabilities", -1), 0.0)),
+            "monthly_income": monthly_income,
+            "monthly_expenses": monthly_expenses
+        }
+    
+    def _get_investment_portfolio(self) -> Dict[str, float]:
+        """
+        Sum investment values by symbol
+        """
+        rows = self.db.query(
+            FinancialProfile.symbol,
+            func.sum(FinancialProfile.amount)
+        ).filter(
+            FinancialProfile.category == "investments",
+            FinancialProfile.symbol.isnot(None),
+            FinancialProfile.symbol != ""
+        ).group_by(FinancialProfile.symbol).all()
+        
+        return {symbol: total for symbol, total in rows}
+    
+    def _get_recent_transactions(self, limit: int) -> List[Dict[str, Any]]:
+        """
+        Get the most recent entries, newest first
+        """
         recent_transactions = self.db.query(FinancialProfile).order_by(
             desc(FinancialProfile.date)
-        ).limit(20).all()
+        ).limit(limit).all()
         
         recent_txns = []
         for txn in recent_transactions:
@@ -131,70 +259,17 @@ class FinanceProfileManager:
                 "subcategory": txn.subcategory
             })
         
-        # Calculate monthly averages (last 3 months)
-        three_months_ago = datetime.now() - timedelta(days=90)
-        
-        monthly_income = self.db.query(func.sum(FinancialProfile.amount)).filter(
-            FinancialProfile.category == "income",
-            FinancialProfile.date >= three_months_ago,
-            FinancialProfile.amount > 0
-        ).scalar() or 0.0
-        monthly_income = monthly_income / 3  # Average over 3 months
-        
-        monthly_expenses = abs(self.db.query(func.sum(FinancialProfile.amount)).filter(
-            FinancialProfile.category.in_(["expenses", "food", "gas", "shopping", "entertainment"]),
-            FinancialProfile.date >= three_months_ago,
-            FinancialProfile.amount < 0
-        ).scalar() or 0.0)
-        monthly_expenses = monthly_expenses / 3  # Average over 3 months
-        
-        return {
-            "total_assets": asset_total,
-            "total_liabilities": liability_total,
-            "net_worth": asset_total - liability_total,
-            "monthly_income": monthly_income,
-            "monthly_expenses": monthly_expenses,
-            "investment_portfolio": investment_portfolio,
-            "credit_accounts": self._get_credit_accounts(),
-            "recent_transactions": recent_txns,
-            "last_updated": datetime.now().isoformat()
-        }
-    
-    def get_chat_context(self) -> Dict[str, Any]:
-        """
-        Get financial context for chat interactions
-        """
-        summary = self.get_profile_summary()
-        
-        # Simplified context for chat
-        return {
-            "net_worth": summary["net_worth"],
-            "monthly_income": summary["monthly_income"],
-            "monthly_expenses": summary["monthly_expenses"],
-            "investment_portfolio": summary["investment_portfolio"],
-            "recent_transactions": summary["recent_transactions"][:5]  # Last 5 transactions
-        }
+        return recent_txns
     
     def _map_category(self, original_category: str) -> str:
         """
         Map AI-detected categories to our standard categories
         """
-        category_mapping = {
-            "food": "expenses",
-            "gas": "expenses", 
-            "shopping": "expenses",
-            "entertainment": "expenses",
-            "income": "income",
-            "salary": "income",
-            "investment": "investments",
-            "stock": "investments",
-            "bond": "investments",
-            "credit": "liabilities",
-            "loan": "liabilities",
-            "mortgage": "liabilities"
-        }
-        
-        return category_mapping.get(original_category.lower(), "other")
+        # LLM output is normally lowercase already; only lowercase on a miss
+        mapped = _CATEGORY_MAP.get(original_category)
+        if mapped is None and isinstance(original_category, str):
+            mapped = _CATEGORY_MAP.get(original_category.lower())
+        return mapped or "other"
     
     def _get_credit_accounts(self) -> List[Dict[str, Any]]:
         """
@@ -213,22 +288,23 @@ class FinanceProfileManager:
         """
         start_date = datetime.now() - timedelta(days=days)
         
-        expenses = self.db.query(FinancialProfile).filter(
+        expense_filters = (
             FinancialProfile.date >= start_date,
             FinancialProfile.amount < 0
-        ).all()
-        
-        category_totals = {}
-        daily_spending = {}
-        
-        for expense in expenses:
-            # Category totals
-            category = expense.category
-            category_totals[category] = category_totals.get(category, 0) + abs(expense.amount)
-            
-            # Daily spending
-            day = expense.date.date().isoformat() if expense.date else "unknown"
-            daily_spending[day] = daily_spending.get(day, 0) + abs(expense.amount)
+        )
+        spent = func.sum(func.abs(FinancialProfile.amount))
+        
+        category_rows = self.db.query(
+            FinancialProfile.category, spent
+        ).filter(*expense_filters).group_by(FinancialProfile.category).all()
+        
+        day = func.date(FinancialProfile.date)
+        daily_rows = self.db.query(
+            day, spent
+        ).filter(*expense_filters).group_by(day).all()
+        
+        category_totals = {category: total for category, total in category_rows}
+        daily_spending = {expense_day: total for expense_day, total in daily_rows}
         
         return {
             "period_days": days,
@@ -0,0 +1,33 @@
+import json
+from datetime import date, datetime
+from typing import Any
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# orjson is several times faster on the multi-megabyte payloads that carry
+# extracted document text; stdlib json is the fallback when it is missing
+if orjson is not None:
+    def dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj)
+
+    def dumps_indented(obj: Any) -> str:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode()
+
+    loads = orjson.loads
+else:
+    # Match orjson's native ISO-8601 output for dates and datetimes
+    def _default(obj: Any) -> Any:
+        if isinstance(obj, (date, datetime)):
+            return obj.isoformat()
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+    def dumps(obj: Any) -> bytes:
+        return json.dumps(obj, default=_default).encode()
+
+    def dumps_indented(obj: Any) -> str:
+        return json.dumps(obj, indent=2, default=_default)
+
+    loads = json.loads
@@ -1,57 +1,323 @@
+import asyncio
+import aiohttp
 import openai
 import anthropic
-from typing import Dict, Any, Optional, List
+from aiolimiter import AsyncLimiter
+from tenacity import AsyncRetrying, retry_if_exception_type, stop_after_attempt, wait_random_exponential
+from typing import Dict, Any, Optional, List, Tuple
+from collections import OrderedDict
+import copy
+import hashlib
 import json
+import time
+
+from . import json_utils
+
+# Responses are cached by a hash of everything sent to the model, so a hit
+# means an identical request (re-uploaded document, repeated question)
+RESPONSE_CACHE_SIZE = 1024
+RESPONSE_CACHE_TTL = 3600
+_response_cache: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+def _cache_key(*parts: str) -> str:
+    return hashlib.blake2b("\x00".join(parts).encode()).hexdigest()
+
+def _cache_get(key: str) -> Optional[Any]:
+    entry = _response_cache.get(key)
+    if entry is None:
+        return None
+    stored_at, value = entry
+    if time.monotonic() - stored_at > RESPONSE_CACHE_TTL:
+        del _response_cache[key]
+        return None
+    _response_cache.move_to_end(key)
+    return copy.deepcopy(value)
+
+def _cache_put(key: str, value: Any):
+    _response_cache[key] = (time.monotonic(), copy.deepcopy(value))
+    _response_cache.move_to_end(key)
+    while len(_response_cache) > RESPONSE_CACHE_SIZE:
+        _response_cache.popitem(last=False)
+
+def _is_cacheable(analysis: Dict[str, Any]) -> bool:
+    # Failed or unparseable replies are retried next time rather than replayed
+    return (isinstance(analysis, dict) and not analysis.get("parsing_error")
+            and analysis.get("success", True) is not False)
+
+def _extract_json(content: str) -> Optional[Dict[str, Any]]:
+    """
+    Recover the first JSON object from a reply wrapped in ```json fences or
+    surrounded by prose. Returns None when no balanced object parses.
+    """
+    text = content.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+        text = text.rsplit("```", 1)[0]
+    
+    start = text.find("{")
+    if start == -1:
+        return None
+    
+    depth = 0
+    in_string = False
+    escaped = False
+    for i in range(start, len(text)):
+        char = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                try:
+                    parsed = json_utils.loads(text[start:i + 1])
+                except json.JSONDecodeError:
+                    return None
+                return parsed if isinstance(parsed, dict) else None
+    return None
+
+# Braces are doubled because every template below goes through str.format
+ANALYSIS_SCHEMA = """{{
+    "document_type": "credit_card|bank_statement|investment|tax_document|other",
+    "date_range": {{
+        "start_date": "YYYY-MM-DD",
+        "end_date": "YYYY-MM-DD"
+    }},
+    "account_info": {{
+        "account_number": "masked account number",
+        "institution": "bank/credit card company name",
+        "account_type": "checking|savings|credit|investment|other"
+    }},
+    "transactions": [
+        {{
+            "date": "YYYY-MM-DD",
+            "description": "transaction description",
+            "amount": -123.45,
+            "category": "food|gas|shopping|entertainment|income|other",
+            "type": "debit|credit"
+        }}
+    ],
+    "summary": {{
+        "total_debits": -1234.56,
+        "total_credits": 5678.90,
+        "net_change": 4444.34,
+        "starting_balance": 1000.00,
+        "ending_balance": 5444.34
+    }},
+    "investments": [
+        {{
+            "symbol": "AAPL",
+            "shares": 10.5,
+            "price": 150.00,
+            "value": 1575.00,
+            "type": "stock|bond|mutual_fund|etf"
+        }}
+    ],
+    "key_insights": [
+        "Notable patterns or important information extracted from the document"
+    ]
+}}"""
+
+ANALYSIS_GUIDELINES = """Ensure all monetary amounts are properly formatted as numbers (positive for credits/income, negative for debits/expenses).
+If certain information is not available, use null or empty arrays as appropriate.
+"""
+
+ANALYSIS_PROMPT_TEMPLATE = """
+Analyze the following {document_type} document and extract structured financial information.
+
+Document Content:
+{text_content}
+
+Please extract and return a JSON object with the following structure:
+""" + ANALYSIS_SCHEMA + """
+
+""" + ANALYSIS_GUIDELINES
+
+ANALYSIS_SYSTEM_PROMPT = "You are a financial document analysis expert. Analyze documents and extract structured financial information."
+
+OPENAI_CHAT_COMPLETIONS_URL = "https://api.openai.com/v1/chat/completions"
+
+# Smaller models are much faster and cheaper for structured extraction
+DEFAULT_MODELS = {
+    "openai": "gpt-4o-mini",
+    "anthropic": "claude-3-5-haiku-latest",
+}
+
+# Client-side ceilings keep bursts under the provider limits instead of
+# discovering them through 429 responses. These are the tier-1 (requests,
+# tokens) per minute limits for the default models; accounts on higher
+# tiers should pass their own.
+DEFAULT_RATE_LIMITS = {
+    "openai": (500, 200000),
+    "anthropic": (50, 50000),
+}
+
+class RateLimitExceeded(RuntimeError):
+    pass
+
+class ServerError(RuntimeError):
+    pass
+
+RATE_LIMIT_ERRORS = (openai.RateLimitError, anthropic.RateLimitError, RateLimitExceeded)
+# What the SDKs would have retried themselves: dropped connections, timeouts,
+# 5xx and Anthropic's 529 overloaded (an InternalServerError)
+TRANSIENT_ERRORS = (
+    openai.APIConnectionError, openai.APITimeoutError, openai.InternalServerError,
+    anthropic.APIConnectionError, anthropic.APITimeoutError, anthropic.InternalServerError,
+    ServerError, aiohttp.ClientConnectionError, asyncio.TimeoutError
+)
 
 class LLMClient:
-    def __init__(self, provider: str, api_key: str):
+    def __init__(self, provider: str, api_key: str,
+                 requests_per_minute: Optional[int] = None,
+                 tokens_per_minute: Optional[int] = None,
+                 analysis_model: Optional[str] = None, chat_model: Optional[str] = None):
         self.provider = provider.lower()
         self.api_key = api_key
+        self.analysis_model = analysis_model or DEFAULT_MODELS.get(self.provider)
+        self.chat_model = chat_model or DEFAULT_MODELS.get(self.provider)
         
+        # Retries happen in _rate_limited; the SDK's own retries would stack on top
         if self.provider == "openai":
-            self.client = openai.OpenAI(api_key=api_key)
+            self.client = openai.AsyncOpenAI(api_key=api_key, max_retries=0)
         elif self.provider == "anthropic":
-            self.client = anthropic.Anthropic(api_key=api_key)
+            self.client = anthropic.AsyncAnthropic(api_key=api_key, max_retries=0)
         else:
             raise ValueError(f"Unsupported LLM provider: {provider}")
+        
+        default_rpm, default_tpm = DEFAULT_RATE_LIMITS[self.provider]
+        self._rpm = AsyncLimiter(requests_per_minute or default_rpm, 60)
+        self._tpm = AsyncLimiter(tokens_per_minute or default_tpm, 60)
+        
+        # Raw HTTP session for bulk OpenAI calls, created on first use
+        self._http_session: Optional[aiohttp.ClientSession] = None
+
+    async def aclose(self):
+        if self._http_session is not None:
+            await self._http_session.close()
+            self._http_session = None
+        await self.client.close()
 
-    async def analyze_financial_document(self, text_content: str, document_type: str = "financial") -> Dict[str, Any]:
+    async def analyze_financial_document(self, text_content: str, document_type: str = "financial",
+                                         bulk: bool = False) -> Dict[str, Any]:
         prompt = self._get_financial_analysis_prompt(text_content, document_type)
         
+        cache_key = _cache_key("analysis", self.provider, self.analysis_model, prompt)
+        cached = _cache_get(cache_key)
+        if cached is not None:
+            return cached
+        
         try:
-            if self.provider == "openai":
-                response = self.client.chat.completions.create(
-                    model="gpt-4",
-                    messages=[
-                        {"role": "system", "content": "You are a financial document analysis expert. Analyze documents and extract structured financial information."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=0.1
-                )
+            body = self._analysis_request_body(prompt)
+            if self.provider == "openai" and bulk:
+                content = await self._rate_limited(prompt, self._post_openai_chat, body)
+            
+            elif self.provider == "openai":
+                response = await self._rate_limited(prompt, self.client.chat.completions.create, **body)
                 content = response.choices[0].message.content
             
             elif self.provider == "anthropic":
-                response = self.client.messages.create(
-                    model="claude-3-sonnet-20240229",
-                    max_tokens=4000,
-                    temperature=0.1,
-                    system="You are a financial document analysis expert. Analyze documents and extract structured financial information.",
-                    messages=[
-                        {"role": "user", "content": prompt}
-                    ]
-                )
+                response = await self._rate_limited(prompt, self.client.messages.create, **body)
                 content = response.content[0].text
             
-            # Parse the JSON response
-            try:
-                return json.loads(content)
-            except json.JSONDecodeError:
-                # If JSON parsing fails, return raw content
-                return {"raw_analysis": content, "parsing_error": True}
+            analysis = self._parse_analysis(content)
+            if _is_cacheable(analysis):
+                _cache_put(cache_key, analysis)
+            return analysis
                 
         except Exception as e:
             return {"error": str(e), "success": False}
 
+    async def _rate_limited(self, prompt: str, call, *args, **kwargs):
+        """
+        Await call(*args, **kwargs) within the request and token budgets,
+        retrying with jittered exponential backoff on residual 429s and
+        transient connection or server errors
+        """
+        # Rough token estimate (1 token ≈ 4 characters), capped at the bucket size
+        estimated_tokens = min(len(prompt) // 4 + 1, self._tpm.max_rate)
+        
+        async for attempt in AsyncRetrying(
+            retry=retry_if_exception_type(RATE_LIMIT_ERRORS + TRANSIENT_ERRORS),
+            wait=wait_random_exponential(min=1, max=60),
+            stop=stop_after_attempt(6),
+            reraise=True
+        ):
+            with attempt:
+                async with self._rpm:
+                    await self._tpm.acquire(estimated_tokens)
+                    return await call(*args, **kwargs)
+
+    async def _post_openai_chat(self, body: Dict[str, Any]) -> str:
+        """
+        Call chat completions over a shared aiohttp session, bypassing the SDK.
+        The SDK's httpx client bottlenecks with many requests in flight.
+        """
+        if self._http_session is None or self._http_session.closed:
+            self._http_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=100, ttl_dns_cache=300),
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json"
+                }
+            )
+        
+        async with self._http_session.post(OPENAI_CHAT_COMPLETIONS_URL, data=json_utils.dumps(body)) as response:
+            payload = await response.read()
+            if response.status == 429:
+                raise RateLimitExceeded(f"OpenAI API rate limit: {payload.decode(errors='replace')}")
+            if response.status >= 500:
+                raise ServerError(f"OpenAI API error {response.status}: {payload.decode(errors='replace')}")
+            if response.status != 200:
+                raise RuntimeError(f"OpenAI API error {response.status}: {payload.decode(errors='replace')}")
+        
+        return json_utils.loads(payload)["choices"][0]["message"]["content"]
+
+    def _analysis_request_body(self, prompt: str) -> Dict[str, Any]:
+        if self.provider == "openai":
+            return {
+                "model": self.analysis_model,
+                "messages": [
+                    {"role": "system", "content": ANALYSIS_SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt}
+                ],
+                "temperature": 0.1,
+                "response_format": {"type": "json_object"}
+            }
+        
+        return {
+            "model": self.analysis_model,
+            "max_tokens": 4000,
+            "temperature": 0.1,
+            "system": ANALYSIS_SYSTEM_PROMPT,
+            "messages": [
+                {"role": "user", "content": prompt}
+            ]
+        }
+
+    def _parse_analysis(self, content: str) -> Dict[str, Any]:
+        # Parse the JSON response
+        try:
+            return json_utils.loads(content)
+        except json.JSONDecodeError:
+            pass
+        
+        # Models sometimes fence the JSON or add a preamble; salvage the object
+        recovered = _extract_json(content)
+        if recovered is not None:
+            return recovered
+        
+        # If JSON parsing fails, return raw content
+        return {"raw_analysis": content, "parsing_error": True}
+
     async def chat_with_context(self, message: str, financial_context: Dict[str, Any]) -> str:
         context_prompt = self._format_financial_context(financial_context)
         full_prompt = f"""
@@ -63,21 +329,30 @@ User Question: {message}
 Please provide a helpful response based on the financial context provided. Be specific and reference actual numbers from the user's financial profile when relevant.
 """
         
+        cache_key = _cache_key("chat", self.provider, self.chat_model, full_prompt)
+        cached = _cache_get(cache_key)
+        if cached is not None:
+            return cached
+        
         try:
             if self.provider == "openai":
-                response = self.client.chat.completions.create(
-                    model="gpt-4",
+                response = await self._rate_limited(
+                    full_prompt,
+                    self.client.chat.completions.create,
+                    model=self.chat_model,
                     messages=[
                         {"role": "system", "content": "You are a personal finance advisor with access to the user's financial profile. Provide helpful, specific advice based on their actual financial data."},
                         {"role": "user", "content": full_prompt}
                     ],
                     temperature=0.3
                 )
-                return response.choices[0].message.content
+                reply = response.choices[0].message.content
             
             elif self.provider == "anthropic":
-                response = self.client.messages.create(
-                    model="claude-3-sonnet-20240229",
+                response = await self._rate_limited(
+                    full_prompt,
+                    self.client.messages.create,
+                    model=self.chat_model,
                     max_tokens=2000,
                     temperature=0.3,
                     system="You are a personal finance advisor with access to the user's financial profile. Provide helpful, specific advice based on their actual financial data.",
@@ -85,63 +360,16 @@ Please provide a helpful response based on the financial context provided. Be sp
                         {"role": "user", "content": full_prompt}
                     ]
                 )
-                return response.content[0].text
+                reply = response.content[0].text
+            
+            _cache_put(cache_key, reply)
+            return reply
                 
         except Exception as e:
             return f"I apologize, but I encountered an error processing your request: {str(e)}"
 
     def _get_financial_analysis_prompt(self, text_content: str, document_type: str) -> str:
-        return f"""
-Analyze the following {document_type} document and extract structured financial information.
-
-Document Content:
-{text_content}
-
-Please extract and return a JSON object with the following structure:
-{{
-    "document_type": "credit_card|bank_statement|investment|tax_document|other",
-    "date_range": {{
-        "start_date": "YYYY-MM-DD",
-        "end_date": "YYYY-MM-DD"
-    }},
-    "account_info": {{
-        "account_number": "masked account number",
-        "institution": "bank/credit card company name",
-        "account_type": "checking|savings|credit|investment|other"
-    }},
-    "transactions": [
-        {{
-            "date": "YYYY-MM-DD",
-            "description": "transaction description",
-            "amount": -123.45,
-            "category": "food|gas|shopping|entertainment|income|other",
-            "type": "debit|credit"
-        }}
-    ],
-    "summary": {{
-        "total_debits": -1234.56,
-        "total_credits": 5678.90,
-        "net_change": 4444.34,
-        "starting_balance": 1000.00,
-        "ending_balance": 5444.34
-    }},
-    "investments": [
-        {{
-            "symbol": "AAPL",
-            "shares": 10.5,
-            "price": 150.00,
-            "value": 1575.00,
-            "type": "stock|bond|mutual_fund|etf"
-        }}
-    ],
-    "key_insights": [
-        "Notable patterns or important information extracted from the document"
-    ]
-}}
-
-Ensure all monetary amounts are properly formatted as numbers (positive for credits/income, negative for debits/expenses).
-If certain information is not available, use null or empty arrays as appropriate.
-"""
+        return ANALYSIS_PROMPT_TEMPLATE.format(document_type=document_type, text_content=text_content)
 
     def _format_financial_context(self, context: Dict[str, Any]) -> str:
         formatted = []
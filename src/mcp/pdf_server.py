@@ -1,8 +1,10 @@
 import asyncio
-import json
+import functools
+import os
+from concurrent.futures import ProcessPoolExecutor
 from typing import Any, Dict, List, Optional
 from pathlib import Path
-import PyMuPDF as fitz
+import fitz
 import pdfplumber
 from mcp.server import Server
 from mcp.server.models import InitializationOptions
@@ -23,6 +25,126 @@ from mcp.types import (
     ReadResourceResult,
 )
 
+from ..core import json_utils
+
+# Page ranges handed to each worker process; small documents stay in one task
+PAGES_PER_TASK = 8
+
+# Plain-text extraction flags without image blocks; a TextPage built with
+# these is extracted directly instead of through the get_text() dispatcher
+TEXTPAGE_FLAGS = fitz.TEXTFLAGS_TEXT & ~fitz.TEXT_PRESERVE_IMAGES
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+def _get_process_pool() -> ProcessPoolExecutor:
+    # Text extraction is CPU-bound and pdfminer holds the GIL, so use processes
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=os.cpu_count())
+    return _process_pool
+
+def _count_pages_pymupdf(file_path: str) -> int:
+    with fitz.open(file_path) as doc:
+        return doc.page_count
+
+def _count_pages_pdfplumber(file_path: str) -> int:
+    with pdfplumber.open(file_path) as pdf:
+        return len(pdf.pages)
+
+def _extract_pages_pymupdf(file_path: str, page_numbers: range) -> str:
+    # Context managers close the document even when a page fails to parse
+    with fitz.open(file_path) as doc:
+        parts = []
+        for page_num in page_numbers:
+            page = doc.load_page(page_num)
+            parts.append(f"\n--- Page {page_num + 1} ---\n")
+            parts.append(page.get_textpage(flags=TEXTPAGE_FLAGS).extractText())
+    return "".join(parts)
+
+def _extract_pages_pdfplumber(file_path: str, page_numbers: range) -> str:
+    with pdfplumber.open(file_path) as pdf:
+        parts = []
+        for page_num in page_numbers:
+            page = pdf.pages[page_num]
+            parts.append(f"\n--- Page {page_num + 1} ---\n")
+            page_text = page.extract_text()
+            if page_text:
+                parts.append(page_text)
+            # Release the page's parsed layout objects before moving on
+            page.flush_cache()
+    return "".join(parts)
+
+def _extract_tables_pdfplumber(file_path: str, page_numbers: Optional[List[int]]) -> List[Dict[str, Any]]:
+    tables = []
+    with pdfplumber.open(file_path) as pdf:
+        pages_to_process = page_numbers if page_numbers else range(len(pdf.pages))
+        
+        for page_num in pages_to_process:
+            if isinstance(page_num, int) and 0 <= page_num < len(pdf.pages):
+                page = pdf.pages[page_num]
+                page_tables = page.extract_tables()
+                page.flush_cache()
+                
+                for table_idx, table in enumerate(page_tables):
+                    tables.append({
+                        "page": page_num + 1,
+                        "table_index": table_idx + 1,
+                        "data": table,
+                        "rows": len(table),
+                        "columns": len(table[0]) if table else 0
+                    })
+    return tables
+
+@functools.lru_cache(maxsize=256)
+def _analyze_structure_cached(file_path: str, mtime_ns: int, size: int) -> Dict[str, Any]:
+    analysis = {}
+    
+    with fitz.open(file_path) as doc:
+        analysis["metadata"] = {
+            "title": doc.metadata.get("title", ""),
+            "author": doc.metadata.get("author", ""),
+            "subject": doc.metadata.get("subject", ""),
+            "creator": doc.metadata.get("creator", ""),
+            "producer": doc.metadata.get("producer", ""),
+            "creation_date": doc.metadata.get("creationDate", ""),
+            "modification_date": doc.metadata.get("modDate", "")
+        }
+        
+        analysis["document_info"] = {
+            "page_count": doc.page_count,
+            "encrypted": doc.is_encrypted,
+            "file_size": size
+        }
+        
+        page_info = []
+        for page_num in range(min(doc.page_count, 10)):  # Analyze first 10 pages
+            page = doc.load_page(page_num)
+            rect = page.rect
+            images = page.get_images()
+            
+            page_analysis = {
+                "page_number": page_num + 1,
+                "width": rect.width,
+                "height": rect.height,
+                "rotation": page.rotation,
+                "has_images": len(images) > 0,
+                "image_count": len(images),
+                "text_length": len(page.get_textpage(flags=TEXTPAGE_FLAGS).extractText()),
+            }
+            
+            page_info.append(page_analysis)
+        
+        analysis["pages"] = page_info
+    
+    return analysis
+
+def _analyze_structure_file(file_path: str, mtime_ns: int, size: int) -> Dict[str, Any]:
+    # Failures raise out of the cached helper so a transient error isn't replayed
+    try:
+        return _analyze_structure_cached(file_path, mtime_ns, size)
+    except Exception as e:
+        return {"error": str(e)}
+
 class PDFProcessingServer:
     def __init__(self):
         self.server = Server("pdf-processor")
@@ -35,7 +157,7 @@ class PDFProcessingServer:
                 tools=[
                     Tool(
                         name="extract_text",
-                        description="Extract text content from PDF file",
+                        description="Extract text content from PDF file (use extract_tables when tabular layout matters)",
                         inputSchema={
                             "type": "object",
                             "properties": {
@@ -47,7 +169,7 @@ class PDFProcessingServer:
                                     "type": "string",
                                     "enum": ["pymupdf", "pdfplumber", "both"],
                                     "description": "Extraction method to use",
-                                    "default": "both"
+                                    "default": "pymupdf"
                                 }
                             },
                             "required": ["file_path"]
@@ -107,43 +229,51 @@ class PDFProcessingServer:
 
     async def _extract_text(self, args: Dict[str, Any]) -> CallToolResult:
         file_path = args["file_path"]
-        method = args.get("method", "both")
+        method = args.get("method", "pymupdf")
         
         if not Path(file_path).exists():
             raise FileNotFoundError(f"PDF file not found: {file_path}")
         
-        results = {}
-        
+        backends = {}
         if method in ["pymupdf", "both"]:
-            try:
-                doc = fitz.open(file_path)
-                pymupdf_text = ""
-                for page_num in range(doc.page_count):
-                    page = doc.load_page(page_num)
-                    pymupdf_text += f"\n--- Page {page_num + 1} ---\n"
-                    pymupdf_text += page.get_text()
-                doc.close()
-                results["pymupdf"] = pymupdf_text
-            except Exception as e:
-                results["pymupdf_error"] = str(e)
-        
+            backends["pymupdf"] = (_count_pages_pymupdf, _extract_pages_pymupdf)
         if method in ["pdfplumber", "both"]:
-            try:
-                with pdfplumber.open(file_path) as pdf:
-                    pdfplumber_text = ""
-                    for page_num, page in enumerate(pdf.pages):
-                        pdfplumber_text += f"\n--- Page {page_num + 1} ---\n"
-                        page_text = page.extract_text()
-                        if page_text:
-                            pdfplumber_text += page_text
-                results["pdfplumber"] = pdfplumber_text
-            except Exception as e:
-                results["pdfplumber_error"] = str(e)
+            backends["pdfplumber"] = (_count_pages_pdfplumber, _extract_pages_pdfplumber)
+        
+        # Run the requested backends concurrently
+        names = list(backends)
+        outputs = await asyncio.gather(
+            *[self._extract_text_sharded(file_path, *backends[name]) for name in names],
+            return_exceptions=True
+        )
+        
+        results = {}
+        for name, output in zip(names, outputs):
+            if isinstance(output, Exception):
+                results[f"{name}_error"] = str(output)
+            else:
+                results[name] = output
         
         return CallToolResult(
-            content=[TextContent(type="text", text=json.dumps(results, indent=2))]
+            content=[TextContent(type="text", text=json_utils.dumps_indented(results))]
         )
 
+    async def _extract_text_sharded(self, file_path: str, count_pages, extract_pages) -> str:
+        """
+        Split the document into page ranges and extract them in worker processes
+        """
+        loop = asyncio.get_running_loop()
+        page_count = await loop.run_in_executor(None, count_pages, file_path)
+        
+        pages = range(page_count)
+        chunks = [pages[start:start + PAGES_PER_TASK] for start in range(0, page_count, PAGES_PER_TASK)]
+        
+        pool = _get_process_pool()
+        texts = await asyncio.gather(
+            *[loop.run_in_executor(pool, extract_pages, file_path, chunk) for chunk in chunks]
+        )
+        return "".join(texts)
+
     async def _extract_tables(self, args: Dict[str, Any]) -> CallToolResult:
         file_path = args["file_path"]
         page_numbers = args.get("page_numbers")
@@ -151,32 +281,19 @@ class PDFProcessingServer:
         if not Path(file_path).exists():
             raise FileNotFoundError(f"PDF file not found: {file_path}")
         
-        tables = []
-        
+        # pdfplumber is pure Python and holds the GIL, so parse in a worker process
+        loop = asyncio.get_running_loop()
         try:
-            with pdfplumber.open(file_path) as pdf:
-                pages_to_process = page_numbers if page_numbers else range(len(pdf.pages))
-                
-                for page_num in pages_to_process:
-                    if isinstance(page_num, int) and 0 <= page_num < len(pdf.pages):
-                        page = pdf.pages[page_num]
-                        page_tables = page.extract_tables()
-                        
-                        for table_idx, table in enumerate(page_tables):
-                            tables.append({
-                                "page": page_num + 1,
-                                "table_index": table_idx + 1,
-                                "data": table,
-                                "rows": len(table),
-                                "columns": len(table[0]) if table else 0
-                            })
+            tables = await loop.run_in_executor(
+                _get_process_pool(), _extract_tables_pdfplumber, file_path, page_numbers
+            )
         except Exception as e:
             return CallToolResult(
                 content=[TextContent(type="text", text=f"Error extracting tables: {str(e)}")]
             )
         
         return CallToolResult(
-            content=[TextContent(type="text", text=json.dumps(tables, indent=2))]
+            content=[TextContent(type="text", text=json_utils.dumps_indented(tables))]
         )
 
     async def _analyze_structure(self, args: Dict[str, Any]) -> CallToolResult:
@@ -185,52 +302,15 @@ class PDFProcessingServer:
         if not Path(file_path).exists():
             raise FileNotFoundError(f"PDF file not found: {file_path}")
         
-        analysis = {}
-        
-        try:
-            doc = fitz.open(file_path)
-            
-            analysis["metadata"] = {
-                "title": doc.metadata.get("title", ""),
-                "author": doc.metadata.get("author", ""),
-                "subject": doc.metadata.get("subject", ""),
-                "creator": doc.metadata.get("creator", ""),
-                "producer": doc.metadata.get("producer", ""),
-                "creation_date": doc.metadata.get("creationDate", ""),
-                "modification_date": doc.metadata.get("modDate", "")
-            }
-            
-            analysis["document_info"] = {
-                "page_count": doc.page_count,
-                "encrypted": doc.is_encrypted,
-                "file_size": Path(file_path).stat().st_size
-            }
-            
-            page_info = []
-            for page_num in range(min(doc.page_count, 10)):  # Analyze first 10 pages
-                page = doc.load_page(page_num)
-                rect = page.rect
-                
-                page_analysis = {
-                    "page_number": page_num + 1,
-                    "width": rect.width,
-                    "height": rect.height,
-                    "rotation": page.rotation,
-                    "has_images": len(page.get_images()) > 0,
-                    "image_count": len(page.get_images()),
-                    "text_length": len(page.get_text()),
-                }
-                
-                page_info.append(page_analysis)
-            
-            analysis["pages"] = page_info
-            doc.close()
-            
-        except Exception as e:
-            analysis["error"] = str(e)
+        # Unchanged files hit the cache; any edit changes mtime or size
+        loop = asyncio.get_running_loop()
+        stat = await loop.run_in_executor(None, os.stat, file_path)
+        analysis = await loop.run_in_executor(
+            None, _analyze_structure_file, file_path, stat.st_mtime_ns, stat.st_size
+        )
         
         return CallToolResult(
-            content=[TextContent(type="text", text=json.dumps(analysis, indent=2))]
+            content=[TextContent(type="text", text=json_utils.dumps_indented(analysis))]
         )
 
     async def run(self):
@@ -250,7 +330,11 @@ class PDFProcessingServer:
 
 async def main():
     server = PDFProcessingServer()
-    await server.run()
+    try:
+        await server.run()
+    finally:
+        if _process_pool is not None:
+            _process_pool.shutdown()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
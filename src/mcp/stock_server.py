@@ -1,7 +1,12 @@
 import asyncio
-import json
+import os
+import random
+import time
 import aiohttp
-from typing import Any, Dict, List, Optional
+import numpy as np
+from aiolimiter import AsyncLimiter
+from types import MappingProxyType
+from typing import Any, Dict, List, Optional, Tuple
 from datetime import datetime, timedelta
 from mcp.server import Server
 from mcp.server.models import InitializationOptions
@@ -15,9 +20,38 @@ from mcp.types import (
     ListToolsResult,
 )
 
+from ..core import json_utils
+
+QUOTE_CACHE_SECONDS = 60
+# Ceiling on Alpha Vantage requests, matching a typical market data API plan;
+# demo quotes are generated locally and are not limited
+QUOTE_REQUESTS_PER_MINUTE = 75
+
+# Demo base prices laid out as an array for the vectorized batch path
+BASE_SYMBOLS = ("AAPL", "MSFT", "GOOGL", "AMZN", "TSLA", "SPY", "QQQ", "DIA")
+BASE_PRICE_ARRAY = np.array([175.00, 330.00, 125.00, 145.00, 200.00, 450.00, 380.00, 340.00])
+BASE_INDEX = {symbol: i for i, symbol in enumerate(BASE_SYMBOLS)}
+# Read-only scalar view of the same prices for single-quote lookups
+BASE_PRICES = MappingProxyType(dict(zip(BASE_SYMBOLS, BASE_PRICE_ARRAY.tolist())))
+DEFAULT_BASE_PRICE = 100.00
+
+ALPHA_VANTAGE_URL = "https://www.alphavantage.co/query"
+# Real quotes are fetched only when a key is configured; otherwise demo data is served
+ALPHA_VANTAGE_API_KEY_ENV = "ALPHA_VANTAGE_API_KEY"
+
 class StockDataServer:
-    def __init__(self):
+    def __init__(self, api_key: Optional[str] = None):
+        self.api_key = api_key
         self.server = Server("stock-data")
+        # Caps concurrent quote lookups when fanning out over many symbols
+        self._semaphore = asyncio.Semaphore(10)
+        # Quotes are reused within the same minute; per-symbol locks stop
+        # concurrent requests for one symbol from all missing the cache at once
+        self._quote_cache: Dict[Tuple[str, int], Dict[str, Any]] = {}
+        self._cache_locks: Dict[str, asyncio.Lock] = {}
+        self._rate_limiter = AsyncLimiter(QUOTE_REQUESTS_PER_MINUTE, 60)
+        # One pooled HTTP session for all upstream calls, created on first use
+        self._session: Optional[aiohttp.ClientSession] = None
         self.setup_handlers()
 
     def setup_handlers(self):
@@ -102,7 +136,7 @@ class StockDataServer:
         # In production, you'd use a real API key
         try:
             # Simulate stock data (replace with real API call)
-            quote_data = await self._fetch_demo_quote(symbol)
+            quote_data = await self._cached_fetch(symbol)
             
             result = {
                 "symbol": symbol,
@@ -114,7 +148,7 @@ class StockDataServer:
             }
             
             return CallToolResult(
-                content=[TextContent(type="text", text=json.dumps(result, indent=2))]
+                content=[TextContent(type="text", text=json_utils.dumps_indented(result))]
             )
             
         except Exception as e:
@@ -127,21 +161,21 @@ class StockDataServer:
         
         summary = {}
         
-        for index in indices:
-            try:
-                quote_data = await self._fetch_demo_quote(index)
+        quotes = await self._fetch_quotes(indices)
+        for index, quote_data in zip(indices, quotes):
+            if isinstance(quote_data, Exception):
+                summary[index] = {"error": str(quote_data)}
+            else:
                 summary[index] = {
                     "price": quote_data["price"],
                     "change": quote_data["change"],
                     "change_percent": quote_data["change_percent"]
                 }
-            except Exception as e:
-                summary[index] = {"error": str(e)}
         
         summary["last_updated"] = datetime.now().isoformat()
         
         return CallToolResult(
-            content=[TextContent(type="text", text=json.dumps(summary, indent=2))]
+            content=[TextContent(type="text", text=json_utils.dumps_indented(summary))]
         )
 
     async def _calculate_portfolio_value(self, args: Dict[str, Any]) -> CallToolResult:
@@ -150,30 +184,29 @@ class StockDataServer:
         portfolio_value = 0.0
         detailed_holdings = []
         
-        for holding in holdings:
-            symbol = holding["symbol"].upper()
-            shares = float(holding["shares"])
-            
-            try:
-                quote_data = await self._fetch_demo_quote(symbol)
-                current_price = quote_data["price"]
-                position_value = shares * current_price
-                portfolio_value += position_value
-                
-                detailed_holdings.append({
-                    "symbol": symbol,
-                    "shares": shares,
-                    "current_price": current_price,
-                    "position_value": position_value,
-                    "change_percent": quote_data["change_percent"]
-                })
-                
-            except Exception as e:
+        positions = [(holding["symbol"].upper(), float(holding["shares"])) for holding in holdings]
+        quotes = await self._fetch_quotes_batch([symbol for symbol, _ in positions])
+        
+        for (symbol, shares), quote_data in zip(positions, quotes):
+            if isinstance(quote_data, Exception):
                 detailed_holdings.append({
                     "symbol": symbol,
                     "shares": shares,
-                    "error": str(e)
+                    "error": str(quote_data)
                 })
+                continue
+            
+            current_price = quote_data["price"]
+            position_value = shares * current_price
+            portfolio_value += position_value
+            
+            detailed_holdings.append({
+                "symbol": symbol,
+                "shares": shares,
+                "current_price": current_price,
+                "position_value": position_value,
+                "change_percent": quote_data["change_percent"]
+            })
         
         result = {
             "total_portfolio_value": portfolio_value,
@@ -182,25 +215,113 @@ class StockDataServer:
         }
         
         return CallToolResult(
-            content=[TextContent(type="text", text=json.dumps(result, indent=2))]
+            content=[TextContent(type="text", text=json_utils.dumps_indented(result))]
         )
 
+    async def _fetch_quotes(self, symbols: List[str]) -> List[Any]:
+        """
+        Fetch quotes for several symbols concurrently, preserving order.
+        Failed lookups are returned as the exception instead of a quote.
+        """
+        async def fetch(symbol: str) -> Dict[str, Any]:
+            async with self._semaphore:
+                return await self._cached_fetch(symbol)
+        
+        results = await asyncio.gather(*[fetch(symbol) for symbol in symbols], return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException) and not isinstance(result, Exception):
+                raise result
+        return results
+
+    async def _cached_fetch(self, symbol: str) -> Dict[str, Any]:
+        bucket = int(time.time() // QUOTE_CACHE_SECONDS)
+        key = (symbol, bucket)
+        if key in self._quote_cache:
+            return self._quote_cache[key]
+        
+        lock = self._cache_locks.setdefault(symbol, asyncio.Lock())
+        async with lock:
+            if key not in self._quote_cache:
+                quote_data = await self._fetch_quote(symbol)
+                self._store_quote(symbol, bucket, quote_data)
+            return self._quote_cache[key]
+
+    async def _fetch_quotes_batch(self, symbols: List[str]) -> List[Any]:
+        """
+        Fetch quotes for several symbols with one upstream call for all cache
+        misses, preserving order. If that fails, each missing symbol gets the
+        exception instead of a quote.
+        """
+        if self.api_key:
+            # Alpha Vantage has no batch quote call; fan out per symbol so one
+            # bad ticker fails alone and only good quotes are cached
+            return await self._fetch_quotes(symbols)
+        
+        bucket = int(time.time() // QUOTE_CACHE_SECONDS)
+        quotes = {}
+        missing = []
+        for symbol in dict.fromkeys(symbols):
+            if (symbol, bucket) in self._quote_cache:
+                quotes[symbol] = self._quote_cache[(symbol, bucket)]
+            else:
+                missing.append(symbol)
+        
+        if missing:
+            try:
+                fetched = await self._fetch_demo_quotes_batch(missing)
+                for symbol, quote_data in zip(missing, fetched):
+                    self._store_quote(symbol, bucket, quote_data)
+                    quotes[symbol] = quote_data
+            except Exception as e:
+                for symbol in missing:
+                    quotes[symbol] = e
+        
+        return [quotes[symbol] for symbol in symbols]
+
+    def _store_quote(self, symbol: str, bucket: int, quote_data: Dict[str, Any]):
+        # Drop quotes from earlier buckets before storing the fresh one
+        for stale_key in [k for k in self._quote_cache if k[1] != bucket]:
+            del self._quote_cache[stale_key]
+        self._quote_cache[(symbol, bucket)] = quote_data
+
+    async def _ensure_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=100, ttl_dns_cache=300, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=10)
+            )
+        return self._session
+
+    async def _fetch_quote(self, symbol: str) -> Dict[str, Any]:
+        if not self.api_key:
+            return await self._fetch_demo_quote(symbol)
+        
+        # Only real network calls count against the upstream quota
+        async with self._rate_limiter:
+            return await self._fetch_alpha_vantage_quote(symbol)
+
+    async def _fetch_alpha_vantage_quote(self, symbol: str) -> Dict[str, Any]:
+        session = await self._ensure_session()
+        params = {"function": "GLOBAL_QUOTE", "symbol": symbol, "apikey": self.api_key}
+        async with session.get(ALPHA_VANTAGE_URL, params=params) as response:
+            response.raise_for_status()
+            data = json_utils.loads(await response.read())
+        
+        quote = data.get("Global Quote")
+        if not quote:
+            raise ValueError(f"No quote returned for {symbol}")
+        
+        return {
+            "price": round(float(quote["05. price"]), 2),
+            "change": round(float(quote["09. change"]), 2),
+            "change_percent": round(float(quote["10. change percent"].rstrip("%")), 2),
+            "volume": int(quote["06. volume"])
+        }
+
     async def _fetch_demo_quote(self, symbol: str) -> Dict[str, Any]:
         # Demo data - replace with real API calls
-        import random
-        
-        base_prices = {
-            "AAPL": 175.00,
-            "MSFT": 330.00,
-            "GOOGL": 125.00,
-            "AMZN": 145.00,
-            "TSLA": 200.00,
-            "SPY": 450.00,
-            "QQQ": 380.00,
-            "DIA": 340.00
-        }
-        
-        base_price = base_prices.get(symbol, 100.00)
+        base_price = BASE_PRICES.get(symbol, DEFAULT_BASE_PRICE)
         
         # Simulate price movement
         change_percent = random.uniform(-3.0, 3.0)
@@ -215,23 +336,56 @@ class StockDataServer:
             "volume": volume
         }
 
+    async def _fetch_demo_quotes_batch(self, symbols: List[str]) -> List[Dict[str, Any]]:
+        # Demo data - replace with a real batch quote API call
+        size = len(symbols)
+        rng = np.random.default_rng()
+        
+        indices = np.array([BASE_INDEX.get(symbol, -1) for symbol in symbols], dtype=int)
+        base_prices = np.where(indices >= 0, BASE_PRICE_ARRAY[indices], DEFAULT_BASE_PRICE)
+        
+        # Simulate price movement for every symbol at once
+        change_percents = rng.uniform(-3.0, 3.0, size=size)
+        changes = base_prices * (change_percents / 100)
+        current_prices = base_prices + changes
+        volumes = rng.integers(1000000, 10000000, size=size, endpoint=True)
+        
+        return [
+            {
+                "price": price,
+                "change": change,
+                "change_percent": change_percent,
+                "volume": volume
+            }
+            for price, change, change_percent, volume in zip(
+                np.round(current_prices, 2).tolist(),
+                np.round(changes, 2).tolist(),
+                np.round(change_percents, 2).tolist(),
+                volumes.tolist()
+            )
+        ]
+
     async def run(self):
-        async with stdio_server() as (read_stream, write_stream):
-            await self.server.run(
-                read_stream,
-                write_stream,
-                InitializationOptions(
-                    server_name="stock-data",
-                    server_version="1.0.0",
-                    capabilities=self.server.get_capabilities(
-                        notification_options=None,
-                        experimental_capabilities=None
+        try:
+            async with stdio_server() as (read_stream, write_stream):
+                await self.server.run(
+                    read_stream,
+                    write_stream,
+                    InitializationOptions(
+                        server_name="stock-data",
+                        server_version="1.0.0",
+                        capabilities=self.server.get_capabilities(
+                            notification_options=None,
+                            experimental_capabilities=None
+                        )
                     )
                 )
-            )
+        finally:
+            if self._session is not None:
+                await self._session.close()
 
 async def main():
-    server = StockDataServer()
+    server = StockDataServer(api_key=os.getenv(ALPHA_VANTAGE_API_KEY_ENV) or None)
     await server.run()
 
 if __name__ == "__main__":
@@ -0,0 +1,138 @@
+import os
+
+# OpenMP/MKL read these when torch loads, so set them before the import below
+EMBEDDING_THREADS = max(1, (os.cpu_count() or 1) - 1)
+os.environ.setdefault("OMP_NUM_THREADS", str(EMBEDDING_THREADS))
+os.environ.setdefault("MKL_NUM_THREADS", str(EMBEDDING_THREADS))
+
+from pathlib import Path
+from typing import List, Union
+import threading
+import numpy as np
+import torch
+from sentence_transformers import SentenceTransformer
+
+try:
+    import onnxruntime as ort
+    from transformers import AutoTokenizer
+except ImportError:
+    ort = None
+
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+QUANTIZED_MODEL_DIR = "data/models/all-MiniLM-L6-v2-int8"
+QUANTIZED_MODEL_FILE = "model_quantized.onnx"
+MAX_SEQUENCE_LENGTH = 256
+
+# One model per process, shared by every RAGVectorStore
+_model = None
+_model_lock = threading.Lock()
+
+class InferenceSentenceTransformer(SentenceTransformer):
+    """
+    SentenceTransformer whose encode() runs without autograd bookkeeping
+    """
+    def encode(self, *args, **kwargs):
+        with torch.inference_mode():
+            return super().encode(*args, **kwargs)
+
+class EmbeddingBackend:
+    """
+    INT8-quantized MiniLM served by ONNX Runtime, with the same encode()
+    signature as SentenceTransformer so callers are unchanged
+    """
+    def __init__(self, model_dir: str = QUANTIZED_MODEL_DIR):
+        model_dir = Path(model_dir)
+        self.tokenizer = AutoTokenizer.from_pretrained(str(model_dir))
+        self.session = ort.InferenceSession(
+            str(model_dir / QUANTIZED_MODEL_FILE),
+            providers=["CPUExecutionProvider"]
+        )
+        self._input_names = {model_input.name for model_input in self.session.get_inputs()}
+    
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32,
+               convert_to_numpy: bool = True, show_progress_bar: bool = False,
+               **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            batches.append(self._encode_batch(texts[start:start + batch_size]))
+        
+        embeddings = np.concatenate(batches) if batches else np.zeros((0, self.dimension), dtype=np.float32)
+        return embeddings[0] if single else embeddings
+    
+    @property
+    def dimension(self) -> int:
+        return self.session.get_outputs()[0].shape[-1]
+    
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encoded = self.tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=MAX_SEQUENCE_LENGTH,
+            return_tensors="np"
+        )
+        inputs = {name: value.astype(np.int64) for name, value in encoded.items() if name in self._input_names}
+        token_embeddings = self.session.run(None, inputs)[0]
+        
+        # Mean-pool over real tokens, then L2 normalize like the original model
+        mask = encoded["attention_mask"][..., np.newaxis].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return (pooled / np.clip(norms, 1e-12, None)).astype(np.float32)
+
+def quantized_model_available(model_dir: str = QUANTIZED_MODEL_DIR) -> bool:
+    return ort is not None and (Path(model_dir) / QUANTIZED_MODEL_FILE).exists()
+
+def export_quantized_model(model_dir: str = QUANTIZED_MODEL_DIR):
+    """
+    Export MiniLM to ONNX and quantize it to dynamic INT8 (run once, offline)
+    """
+    from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    
+    model = ORTModelForFeatureExtraction.from_pretrained(EMBEDDING_MODEL_NAME, export=True)
+    model.save_pretrained(model_dir)
+    AutoTokenizer.from_pretrained(EMBEDDING_MODEL_NAME).save_pretrained(model_dir)
+    
+    quantizer = ORTQuantizer.from_pretrained(model)
+    quantizer.quantize(
+        save_dir=model_dir,
+        quantization_config=AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+    )
+
+def get_embedding_model():
+    """
+    Load the embedding model once, preferring the INT8 ONNX export when it has been built
+    """
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                if quantized_model_available():
+                    _model = EmbeddingBackend()
+                else:
+                    _configure_torch_threads()
+                    model = InferenceSentenceTransformer('all-MiniLM-L6-v2', device='cpu')
+                    model.eval()
+                    _model = model
+    return _model
+
+def _configure_torch_threads():
+    torch.set_num_threads(EMBEDDING_THREADS)
+    try:
+        torch.set_num_interop_threads(2)
+    except RuntimeError:
+        # Only settable before torch starts any inter-op parallel work
+        pass
+
+def warmup_embedding_model():
+    """
+    Load the model and run one encode so the first real query doesn't pay for it
+    """
+    try:
+        get_embedding_model().encode([""], normalize_embeddings=True, show_progress_bar=False)
+    except Exception as e:
+        print(f"Embedding model warmup failed: {e}")
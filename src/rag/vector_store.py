@@ -1,16 +1,66 @@
 import chromadb
 from chromadb.config import Settings
-from sentence_transformers import SentenceTransformer
-from typing import List, Dict, Any, Optional
+from sqlalchemy import select, delete
+from sqlalchemy.orm import Session
+from typing import List, Dict, Any, Optional, Tuple
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import copy
+import functools
+import threading
 import uuid
 from pathlib import Path
 import json
+import numpy as np
+
+from .embeddings import get_embedding_model
+from ..ui.backend.models import RAGDocument
+
+EMBEDDING_BATCH_SIZE = 32
+# Chunks per collection write when ingesting large documents
+INGEST_BATCH_SIZE = 256
+
+# Repeated chat queries skip both the transformer and the Chroma query
+QUERY_EMBEDDING_CACHE_SIZE = 1024
+SEARCH_CACHE_SIZE = 512
+
+# Chunks written by earlier versions carry an int8 code in their metadata;
+# it is never read any more, only stripped from returned metadata
+SQ8_CODE_KEY = "sq8_code"
+SQ8_SCALE_KEY = "sq8_scale"
+
+# Chat context: one int8 matmul over in-memory codes of every chunk picks
+# candidates that are then rescored exactly against their float32 embeddings
+CONTEXT_CANDIDATES = 40
+CONTEXT_RESULTS = 10
+# Embeddings fetched per collection.get when building the code index
+CODE_INDEX_LOAD_BATCH_SIZE = 4096
+
+# In-memory int8 codes for the context prefilter, one index per persist
+# directory shared by every store on it: loaded from Chroma once, then kept
+# current by add/delete instead of being rebuilt per write or per instance
+_code_indexes: Dict[str, Dict[str, Any]] = {}
+_code_index_lock = threading.Lock()
+
+def _quantize(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Symmetric per-vector int8 quantization: vector ~= code * scale
+    """
+    scales = np.abs(vectors).max(axis=1) / 127
+    scales[scales == 0] = 1.0
+    codes = np.round(vectors / scales[:, np.newaxis]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+def _public_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: value for key, value in metadata.items() if key not in (SQ8_CODE_KEY, SQ8_SCALE_KEY)}
 
 class RAGVectorStore:
-    def __init__(self, persist_directory: str = "data/chromadb"):
+    def __init__(self, persist_directory: str = "data/chromadb", db: Optional[Session] = None):
         """
-        Initialize the RAG vector store with ChromaDB
+        Initialize the RAG vector store with ChromaDB. When a database session
+        is given, per-document chunk counts are kept in the rag_documents table.
         """
+        self.db = db
         self.persist_directory = Path(persist_directory)
         self.persist_directory.mkdir(parents=True, exist_ok=True)
         
@@ -23,57 +73,174 @@ class RAGVectorStore:
             )
         )
         
-        # Initialize embedding model
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+        # Shared embedding model, loaded on first use
+        self.embedding_model = get_embedding_model()
         
         # Get or create collection
-        self.collection = self.client.get_or_create_collection(
+        self.collection = self._get_collection()
+        
+        # Search results are keyed by a version that every write bumps
+        self._encode_query_cached = functools.lru_cache(maxsize=QUERY_EMBEDDING_CACHE_SIZE)(self._encode_query)
+        self._search_cache: "OrderedDict[Tuple[int, str, int], List[Dict[str, Any]]]" = OrderedDict()
+        self._search_lock = threading.Lock()
+        self._version = 0
+        self._index_key = str(self.persist_directory.resolve())
+    
+    def _get_collection(self):
+        # Embeddings are unit length, so inner product is cosine similarity;
+        # collections created before this keep their original L2 space
+        collection = self.client.get_or_create_collection(
             name="financial_documents",
-            metadata={"description": "Financial documents for RAG"}
+            metadata={"description": "Financial documents for RAG", "hnsw:space": "ip"}
         )
+        self._distance_space = (collection.metadata or {}).get("hnsw:space", "l2")
+        return collection
+    
+    def _chroma_similarity(self, distance: float) -> float:
+        if self._distance_space == "ip":
+            return 1 - distance
+        # Squared L2 between unit vectors
+        return 1 - distance / 2
     
     def add_document(self, document_id: str, text: str, metadata: Dict[str, Any] = None) -> List[str]:
         """
         Add a document to the vector store by chunking and embedding it
         """
-        chunks = self._chunk_text(text)
-        chunk_ids = []
+        return self.add_documents([(document_id, text, metadata)])[0]
+    
+    def add_documents(self, documents: List[Tuple[str, str, Optional[Dict[str, Any]]]]) -> List[List[str]]:
+        """
+        Add several (document_id, text, metadata) documents with one embedding
+        pass and one collection write, returning each document's chunk ids
+        """
+        all_ids = []
+        all_chunks = []
+        all_metadatas = []
+        chunk_ids_per_document = []
         
-        for i, chunk in enumerate(chunks):
-            chunk_id = f"{document_id}_chunk_{i}"
-            chunk_ids.append(chunk_id)
-            
-            # Create embedding
-            embedding = self.embedding_model.encode(chunk).tolist()
-            
-            # Prepare metadata
-            chunk_metadata = {
-                "document_id": document_id,
-                "chunk_index": i,
-                "total_chunks": len(chunks),
-                **(metadata or {})
-            }
+        for document_id, text, metadata in documents:
+            chunks = self._chunk_text(text)
+            chunk_ids = [f"{document_id}_chunk_{i}" for i in range(len(chunks))]
+            chunk_ids_per_document.append(chunk_ids)
             
-            # Add to collection
-            self.collection.add(
-                ids=[chunk_id],
-                embeddings=[embedding],
-                documents=[chunk],
-                metadatas=[chunk_metadata]
+            all_ids.extend(chunk_ids)
+            all_chunks.extend(chunks)
+            all_metadatas.extend(
+                {
+                    "document_id": document_id,
+                    "chunk_index": i,
+                    "total_chunks": len(chunks),
+                    **(metadata or {})
+                }
+                for i in range(len(chunks))
             )
         
-        return chunk_ids
+        if not all_chunks:
+            return chunk_ids_per_document
+        
+        # Encode micro-batch i+1 while a writer thread adds micro-batch i; at most
+        # one write is in flight, so only two batches are held at a time.
+        # Documents up to INGEST_BATCH_SIZE chunks still go in a single write.
+        with ThreadPoolExecutor(max_workers=1) as writer:
+            pending = None
+            for start in range(0, len(all_chunks), INGEST_BATCH_SIZE):
+                end = start + INGEST_BATCH_SIZE
+                embeddings = self.embedding_model.encode(
+                    all_chunks[start:end],
+                    batch_size=EMBEDDING_BATCH_SIZE,
+                    convert_to_numpy=True,
+                    normalize_embeddings=True,
+                    show_progress_bar=False
+                )
+                
+                if pending is not None:
+                    pending.result()
+                pending = writer.submit(
+                    self._add_batch,
+                    all_ids[start:end],
+                    np.asarray(embeddings, dtype=np.float32),
+                    all_chunks[start:end],
+                    all_metadatas[start:end]
+                )
+            pending.result()
+        self._invalidate_search_cache()
+        
+        if self.db is not None:
+            self._record_documents(documents, chunk_ids_per_document)
+        
+        return chunk_ids_per_document
+    
+    def _record_documents(self, documents: List[Tuple[str, str, Optional[Dict[str, Any]]]],
+                          chunk_ids_per_document: List[List[str]]):
+        existing = {
+            row.embedding_id: row
+            for row in self.db.query(RAGDocument).filter(
+                RAGDocument.embedding_id.in_([document_id for document_id, _, _ in documents])
+            )
+        }
+        
+        for (document_id, text, metadata), chunk_ids in zip(documents, chunk_ids_per_document):
+            metadata = metadata or {}
+            row = existing.get(document_id)
+            if row is None:
+                row = RAGDocument(embedding_id=document_id)
+                self.db.add(row)
+                existing[document_id] = row
+            row.filename = metadata.get("filename", document_id)
+            row.filepath = metadata.get("filepath", "")
+            row.chunk_count = len(chunk_ids)
+            # Same shape list_documents reports from a document's first chunk
+            row.document_metadata = json.dumps({
+                "document_id": document_id,
+                "chunk_index": 0,
+                "total_chunks": len(chunk_ids),
+                **metadata
+            })
+            row.processed = True
+        
+        try:
+            self.db.commit()
+        except Exception as e:
+            self.db.rollback()
+            print(f"Error recording RAG documents: {e}")
+    
+    def encode_queries(self, queries: List[str]) -> List[List[float]]:
+        """
+        Embed several queries in one batch
+        """
+        return self.embedding_model.encode(
+            queries,
+            batch_size=EMBEDDING_BATCH_SIZE,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False
+        ).tolist()
+    
+    def _encode_query(self, query: str) -> Tuple[float, ...]:
+        return tuple(self.encode_queries([query])[0])
+    
+    def _invalidate_search_cache(self):
+        with self._search_lock:
+            self._version += 1
+            self._search_cache.clear()
     
     def search(self, query: str, n_results: int = 5) -> List[Dict[str, Any]]:
         """
         Search for relevant document chunks
         """
+        with self._search_lock:
+            cache_key = (self._version, query, n_results)
+            cached = self._search_cache.get(cache_key)
+            if cached is not None:
+                self._search_cache.move_to_end(cache_key)
+                return copy.deepcopy(cached)
+        
         # Create query embedding
-        query_embedding = self.embedding_model.encode(query).tolist()
+        query_embedding = self._encode_query_cached(query)
         
         # Search the collection
         results = self.collection.query(
-            query_embeddings=[query_embedding],
+            query_embeddings=[list(query_embedding)],
             n_results=n_results,
             include=['documents', 'metadatas', 'distances']
         )
@@ -81,16 +248,67 @@ class RAGVectorStore:
         # Format results
         formatted_results = []
         if results['documents'] and results['documents'][0]:
-            for i in range(len(results['documents'][0])):
+            for document, metadata, chroma_distance in zip(
+                results['documents'][0], results['metadatas'][0], results['distances'][0]
+            ):
+                # Cosine distance, whatever space the collection was built with
+                distance = 1 - self._chroma_similarity(chroma_distance)
                 formatted_results.append({
-                    'document': results['documents'][0][i],
-                    'metadata': results['metadatas'][0][i],
-                    'distance': results['distances'][0][i],
-                    'relevance_score': 1 - results['distances'][0][i]  # Convert distance to similarity
+                    'document': document,
+                    'metadata': _public_metadata(metadata),
+                    'distance': distance,
+                    'relevance_score': 1 - distance  # Convert distance to similarity
                 })
         
+        with self._search_lock:
+            # A write that landed mid-query bumped the version; don't cache stale results
+            if cache_key[0] == self._version:
+                self._search_cache[cache_key] = copy.deepcopy(formatted_results)
+                while len(self._search_cache) > SEARCH_CACHE_SIZE:
+                    self._search_cache.popitem(last=False)
+        
         return formatted_results
     
+    def _add_batch(self, ids: List[str], embeddings: np.ndarray, chunks: List[str],
+                   metadatas: List[Dict[str, Any]]):
+        self.collection.add(
+            ids=ids,
+            embeddings=embeddings.tolist(),
+            documents=chunks,
+            metadatas=metadatas
+        )
+        
+        with _code_index_lock:
+            index = _code_indexes.get(self._index_key)
+            if index is None:
+                return
+            # A load racing this write may already have picked these rows up
+            new_rows = [i for i, chunk_id in enumerate(ids) if chunk_id not in index["id_set"]]
+            if not new_rows:
+                return
+            new_ids = [ids[i] for i in new_rows]
+            codes, scales = _quantize(embeddings[new_rows])
+            _code_indexes[self._index_key] = {
+                "ids": index["ids"] + new_ids,
+                "id_set": index["id_set"] | set(new_ids),
+                "codes": np.concatenate([index["codes"], codes]),
+                "scales": np.concatenate([index["scales"], scales])
+            }
+    
+    def _remove_from_code_index(self, ids: List[str]):
+        with _code_index_lock:
+            index = _code_indexes.get(self._index_key)
+            if index is None:
+                return
+            removed = set(ids)
+            keep = [i for i, chunk_id in enumerate(index["ids"]) if chunk_id not in removed]
+            _code_indexes[self._index_key] = {
+                "ids": [index["ids"][i] for i in keep],
+                "id_set": index["id_set"] - removed,
+                "codes": index["codes"][keep],
+                "scales": index["scales"][keep]
+            }
+    
     def delete_document(self, document_id: str) -> bool:
         """
         Delete all chunks for a document
@@ -102,8 +320,14 @@ class RAGVectorStore:
                 include=['ids']
             )
             
+            if self.db is not None:
+                self.db.execute(delete(RAGDocument).where(RAGDocument.embedding_id == document_id))
+                self.db.commit()
+            
             if results['ids']:
                 self.collection.delete(ids=results['ids'])
+                self._remove_from_code_index(results['ids'])
+                self._invalidate_search_cache()
                 return True
             return False
         except Exception as e:
@@ -123,7 +347,7 @@ class RAGVectorStore:
             return {"exists": False}
         
         chunk_count = len(results['metadatas'])
-        first_metadata = results['metadatas'][0] if results['metadatas'] else {}
+        first_metadata = _public_metadata(results['metadatas'][0]) if results['metadatas'] else {}
         
         return {
             "exists": True,
@@ -136,6 +360,22 @@ class RAGVectorStore:
         """
         List all documents in the vector store
         """
+        # The rag_documents table already holds one row per document; rows
+        # recorded before document_metadata existed fall back to Chroma
+        if self.db is not None:
+            rows = self.db.execute(
+                select(RAGDocument.embedding_id, RAGDocument.chunk_count, RAGDocument.document_metadata)
+            ).all()
+            if all(row.document_metadata is not None for row in rows):
+                return [
+                    {
+                        'document_id': row.embedding_id,
+                        'chunk_count': row.chunk_count,
+                        'metadata': json.loads(row.document_metadata)
+                    }
+                    for row in rows
+                ]
+        
         # Get all entries
         results = self.collection.get(include=['metadatas'])
         
@@ -151,7 +391,7 @@ class RAGVectorStore:
                     documents[doc_id] = {
                         'document_id': doc_id,
                         'chunk_count': 0,
-                        'metadata': metadata
+                        'metadata': _public_metadata(metadata)
                     }
                 documents[doc_id]['chunk_count'] += 1
         
@@ -167,19 +407,33 @@ class RAGVectorStore:
         chunks = []
         start = 0
         
+        # For long texts, locate every boundary once instead of rfind per chunk.
+        # latin-1 keeps one byte per character so positions match string indices.
+        boundaries = None
+        if len(text) > 4 * chunk_size:
+            buffer = np.frombuffer(text.encode('latin-1', 'replace'), dtype=np.uint8)
+            boundaries = (np.flatnonzero(buffer == ord('.')), np.flatnonzero(buffer == ord(' ')))
+        
         while start < len(text):
             # Find end position
             end = start + chunk_size
             
             # If this is not the last chunk, try to break at a sentence or word boundary
             if end < len(text):
+                if boundaries is not None:
+                    sentence_end = self._last_before(boundaries[0], start, end)
+                else:
+                    sentence_end = text.rfind('.', start, end)
+                
                 # Look for sentence boundary
-                sentence_end = text.rfind('.', start, end)
                 if sentence_end > start + chunk_size // 2:
                     end = sentence_end + 1
                 else:
                     # Look for word boundary
-                    word_end = text.rfind(' ', start, end)
+                    if boundaries is not None:
+                        word_end = self._last_before(boundaries[1], start, end)
+                    else:
+                        word_end = text.rfind(' ', start, end)
                     if word_end > start + chunk_size // 2:
                         end = word_end
             
@@ -194,11 +448,91 @@ class RAGVectorStore:
         
         return chunks
     
+    @staticmethod
+    def _last_before(positions: np.ndarray, start: int, end: int) -> int:
+        """
+        Last position in [start, end), or -1, matching str.rfind
+        """
+        idx = np.searchsorted(positions, end) - 1
+        if idx >= 0 and positions[idx] >= start:
+            return int(positions[idx])
+        return -1
+    
+    def _load_code_index(self) -> Dict[str, Any]:
+        """
+        Int8 codes and scales for every chunk, quantized from Chroma's float32
+        embeddings on first use and maintained incrementally afterwards
+        """
+        with _code_index_lock:
+            if self._index_key not in _code_indexes:
+                ids = []
+                codes = []
+                scales = []
+                offset = 0
+                while True:
+                    results = self.collection.get(
+                        include=['embeddings'],
+                        limit=CODE_INDEX_LOAD_BATCH_SIZE,
+                        offset=offset
+                    )
+                    if not results['ids']:
+                        break
+                    batch_codes, batch_scales = _quantize(np.asarray(results['embeddings'], dtype=np.float32))
+                    ids.extend(results['ids'])
+                    codes.append(batch_codes)
+                    scales.append(batch_scales)
+                    offset += len(results['ids'])
+                
+                _code_indexes[self._index_key] = {
+                    "ids": ids,
+                    "id_set": set(ids),
+                    "codes": np.concatenate(codes) if codes else np.zeros((0, 0), dtype=np.int8),
+                    "scales": np.concatenate(scales) if scales else np.zeros(0, dtype=np.float32)
+                }
+            return _code_indexes[self._index_key]
+    
+    def _prefiltered_search(self, query: str, n_results: int) -> List[Dict[str, Any]]:
+        """
+        Score every chunk with one int8 matmul, then rerank the top
+        CONTEXT_CANDIDATES against their float32 embeddings
+        """
+        index = self._load_code_index()
+        if not index["ids"]:
+            return []
+        
+        query_embedding = np.asarray(self._encode_query_cached(query), dtype=np.float32)
+        scores = (index["codes"] @ query_embedding) * index["scales"]
+        
+        k = min(CONTEXT_CANDIDATES, len(index["ids"]))
+        candidates = np.argpartition(-scores, k - 1)[:k]
+        fetched = self.collection.get(
+            ids=[index["ids"][i] for i in candidates],
+            include=['embeddings', 'documents', 'metadatas']
+        )
+        if not fetched['ids']:
+            return []
+        
+        similarities = np.asarray(fetched['embeddings'], dtype=np.float32) @ query_embedding
+        order = np.argsort(-similarities)[:n_results]
+        
+        formatted_results = []
+        for i in order:
+            # Cosine distance, the same scale search() reports
+            distance = 1 - float(similarities[i])
+            formatted_results.append({
+                'document': fetched['documents'][i],
+                'metadata': _public_metadata(fetched['metadatas'][i]),
+                'distance': distance,
+                'relevance_score': 1 - distance
+            })
+        
+        return formatted_results
+    
     def get_context_for_query(self, query: str, max_tokens: int = 2000) -> str:
         """
         Get relevant context for a query, respecting token limits
         """
-        results = self.search(query, n_results=10)
+        results = self._prefiltered_search(query, CONTEXT_RESULTS)
         
         context_parts = []
         current_tokens = 0
@@ -220,7 +554,11 @@ class RAGVectorStore:
         Reset the entire vector store (useful for testing)
         """
         self.client.reset()
-        self.collection = self.client.get_or_create_collection(
-            name="financial_documents",
-            metadata={"description": "Financial documents for RAG"}
-        )
\ No newline at end of file
+        self.collection = self._get_collection()
+        with _code_index_lock:
+            _code_indexes.pop(self._index_key, None)
+        self._invalidate_search_cache()
+        
+        if self.db is not None:
+            self.db.execute(delete(RAGDocument))
+            self.db.commit()
\ No newline at end of file
@@ -1,6 +1,7 @@
 import pystray
 from pystray import MenuItem as item
 from PIL import Image, ImageDraw
+import socket
 import threading
 import webbrowser
 import subprocess
@@ -10,6 +11,9 @@ from pathlib import Path
 import uvicorn
 import time
 
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8000
+
 class FinanceAgentTray:
     def __init__(self):
         self.icon = None
@@ -36,56 +40,46 @@ class FinanceAgentTray:
     def start_backend_server(self):
         try:
             from ..ui.backend.main import app
-            config = uvicorn.Config(app, host="127.0.0.1", port=8000, log_level="info")
+            config = uvicorn.Config(app, host=SERVER_HOST, port=SERVER_PORT, log_level="info")
             server = uvicorn.Server(config)
             server.run()
         except Exception as e:
             print(f"Failed to start backend server: {e}")
 
-    def open_app(self, icon, item):
+    def _wait_ready(self, host: str, port: int, timeout: float = 5.0) -> bool:
+        # Poll until uvicorn accepts connections instead of sleeping a fixed time
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                with socket.create_connection((host, port), timeout=0.05):
+                    return True
+            except OSError:
+                time.sleep(0.025)
+        return False
+
+    def _open(self, path: str = ""):
         if not self.running:
             self.server_thread = threading.Thread(target=self.start_backend_server, daemon=True)
             self.server_thread.start()
             self.running = True
-            time.sleep(2)
+            self._wait_ready(SERVER_HOST, SERVER_PORT)
         
-        webbrowser.open('http://127.0.0.1:8000')
+        webbrowser.open(f'http://{SERVER_HOST}:{SERVER_PORT}{path}')
+
+    def open_app(self, icon, item):
+        self._open()
 
     def open_settings(self, icon, item):
-        if not self.running:
-            self.server_thread = threading.Thread(target=self.start_backend_server, daemon=True)
-            self.server_thread.start()
-            self.running = True
-            time.sleep(2)
-        
-        webbrowser.open('http://127.0.0.1:8000/settings')
+        self._open('/settings')
 
     def open_documents(self, icon, item):
-        if not self.running:
-            self.server_thread = threading.Thread(target=self.start_backend_server, daemon=True)
-            self.server_thread.start()
-            self.running = True
-            time.sleep(2)
-        
-        webbrowser.open('http://127.0.0.1:8000/documents')
+        self._open('/documents')
 
     def open_chat(self, icon, item):
-        if not self.running:
-            self.server_thread = threading.Thread(target=self.start_backend_server, daemon=True)
-            self.server_thread.start()
-            self.running = True
-            time.sleep(2)
-        
-        webbrowser.open('http://127.0.0.1:8000/chat')
+        self._open('/chat')
 
     def open_rag(self, icon, item):
-        if not self.running:
-            self.server_thread = threading.Thread(target=self.start_backend_server, daemon=True)
-            self.server_thread.start()
-            self.running = True
-            time.sleep(2)
-        
-        webbrowser.open('http://127.0.0.1:8000/rag')
+        self._open('/rag')
 
     def quit_app(self, icon, item):
         self.running = False
@@ -1,4 +1,6 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import QueuePool
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
@@ -9,7 +11,32 @@ data_dir.mkdir(exist_ok=True)
 
 DATABASE_URL = f"sqlite:///{data_dir}/finance_agent.db"
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=QueuePool,
+    pool_size=8
+)
+
+# WAL lets readers proceed during writes; NORMAL sync is safe under WAL and
+# skips most fsyncs; mmap and a larger page cache avoid read() syscalls
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-20000",
+)
+
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(pragma)
+    finally:
+        cursor.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -21,6 +48,33 @@ def get_db():
     finally:
         db.close()
 
+# Columns added to existing tables since the first release, as (table, column, type)
+ADDED_COLUMNS = (
+    ("financial_profiles", "symbol", "VARCHAR"),
+    ("rag_documents", "document_metadata", "TEXT"),
+)
+
+def _add_missing_columns():
+    """
+    create_all never alters existing tables, so add newer columns to databases
+    created by older versions
+    """
+    with engine.begin() as connection:
+        for table, column, column_type in ADDED_COLUMNS:
+            existing = {row[1] for row in connection.exec_driver_sql(f"PRAGMA table_info({table})")}
+            if existing and column not in existing:
+                connection.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+
 def init_db():
     from .models import Settings, Document, FinancialProfile, ChatMessage, RAGDocument
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    Base.metadata.create_all(bind=engine)
+    _add_missing_columns()
+    
+    # create_all only builds indexes for new tables, so add any missing ones
+    for model in (Document, FinancialProfile, ChatMessage):
+        for index in model.__table__.indexes:
+            try:
+                index.create(bind=engine, checkfirst=True)
+            except OperationalError as e:
+                # A missing index only costs speed; don't block startup over it
+                print(f"Index {index.name} creation error: {e}")
@@ -1,14 +1,18 @@
 from fastapi import FastAPI, HTTPException, UploadFile, File, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, ORJSONResponse, StreamingResponse
+from sqlalchemy import insert, select
 from sqlalchemy.orm import Session
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+import asyncio
+import hashlib
 import os
-import json
 from pathlib import Path
-from typing import List, Optional
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Set, Tuple
 
 from .database import get_db, init_db
+from .static_files import CompressedStaticFiles
 from .models import Settings, Document, FinancialProfile, ChatMessage
 from .schemas import (
     SettingsCreate, SettingsResponse,
@@ -19,8 +23,14 @@ from .schemas import (
 from ...core.llm_client import LLMClient
 from ...core.document_processor import DocumentProcessor
 from ...core.finance_profile import FinanceProfileManager
+from ...core import json_utils
 
-app = FastAPI(title="Personal Finance Agent API", version="1.0.0")
+app = FastAPI(
+    title="Personal Finance Agent API",
+    version="1.0.0",
+    # orjson is optional; fall back to the stdlib-backed response without it
+    default_response_class=ORJSONResponse if json_utils.orjson is not None else JSONResponse
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -30,9 +40,108 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+document_processor = DocumentProcessor()
+
+# Upload writes and PDF page parsing run via asyncio.to_thread; size the
+# default pool to the machine so concurrent uploads overlap across cores
+UPLOAD_CHUNK_SIZE = 1 << 20
+executor = ThreadPoolExecutor(max_workers=os.cpu_count())
+
+# List endpoints fetch plain rows in batches and stream them as a JSON array
+STREAM_BATCH_SIZE = 500
+
+def _stream_json_array(result) -> Iterator[bytes]:
+    yield b"["
+    first = True
+    for partition in result.mappings().partitions():
+        body = b",".join(json_utils.dumps(dict(row)) for row in partition)
+        yield body if first else b"," + body
+        first = False
+    yield b"]"
+
+def _env_int(name: str) -> Optional[int]:
+    value = os.getenv(name)
+    return int(value) if value else None
+
+# Provider rate limits for the account's tier; unset means the tier-1 defaults
+LLM_REQUESTS_PER_MINUTE = _env_int("PFA_LLM_REQUESTS_PER_MINUTE")
+LLM_TOKENS_PER_MINUTE = _env_int("PFA_LLM_TOKENS_PER_MINUTE")
+
+# Chat clients are reused so their HTTP connection pools stay warm across turns
+_llm_clients: Dict[Tuple[str, str], LLMClient] = {}
+
+def _get_llm_client(provider: str, api_key: str) -> LLMClient:
+    key = (provider, hashlib.sha256(api_key.encode()).hexdigest())
+    client = _llm_clients.get(key)
+    if client is None:
+        client = LLMClient(
+            provider=provider,
+            api_key=api_key,
+            requests_per_minute=LLM_REQUESTS_PER_MINUTE,
+            tokens_per_minute=LLM_TOKENS_PER_MINUTE
+        )
+        _llm_clients[key] = client
+    return client
+
+# A settings change retires the cached clients; ones still serving a request
+# are closed when their last in-flight call finishes, not under it
+_llm_client_users: Dict[LLMClient, int] = {}
+_retired_llm_clients: Set[LLMClient] = set()
+
+@asynccontextmanager
+async def _use_llm_client(provider: str, api_key: str) -> AsyncIterator[LLMClient]:
+    client = _get_llm_client(provider, api_key)
+    _llm_client_users[client] = _llm_client_users.get(client, 0) + 1
+    try:
+        yield client
+    finally:
+        _llm_client_users[client] -= 1
+        if not _llm_client_users[client]:
+            del _llm_client_users[client]
+            if client in _retired_llm_clients:
+                _retired_llm_clients.discard(client)
+                await client.aclose()
+
+async def _retire_llm_clients():
+    clients = list(_llm_clients.values())
+    _llm_clients.clear()
+    for client in clients:
+        if client in _llm_client_users:
+            _retired_llm_clients.add(client)
+        else:
+            await client.aclose()
+
+async def _close_llm_clients():
+    await _retire_llm_clients()
+    clients = list(_retired_llm_clients)
+    _retired_llm_clients.clear()
+    for client in clients:
+        await client.aclose()
+
+# The embedding model pulls in torch, so it is only loaded when RAG is on
+RAG_ENABLED = os.getenv("PFA_ENABLE_RAG", "").lower() in ("1", "true", "yes")
+
+def _warmup_rag():
+    try:
+        from ...rag.embeddings import warmup_embedding_model
+    except ImportError as e:
+        print(f"RAG embeddings unavailable: {e}")
+        return
+    warmup_embedding_model()
+
 @app.on_event("startup")
 async def startup_event():
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(executor)
     init_db()
+    if RAG_ENABLED:
+        # Import and load the model in the background so startup isn't held up
+        loop.run_in_executor(None, _warmup_rag)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await document_processor.close()
+    await _close_llm_clients()
 
 @app.get("/health")
 async def health_check():
@@ -65,14 +174,22 @@ async def update_settings(settings_data: SettingsCreate, db: Session = Depends(g
     
     db.commit()
     db.refresh(settings)
+    
+    # Provider or key may have changed
+    await _retire_llm_clients()
     return SettingsResponse.from_orm(settings)
 
-@app.post("/api/documents/upload")
-async def upload_document(
-    file: UploadFile = File(...),
-    document_type: str = "financial",
-    db: Session = Depends(get_db)
-):
+def bulk_add_documents(db: Session, docs: List[Dict]) -> List[Document]:
+    """
+    Insert several document rows with one executemany INSERT ... RETURNING and one commit
+    """
+    if not docs:
+        return []
+    documents = db.scalars(insert(Document).returning(Document), docs).all()
+    db.commit()
+    return documents
+
+async def _ingest_upload(file: UploadFile, document_type: str) -> Dict:
     if not file.filename.lower().endswith('.pdf'):
         raise HTTPException(status_code=400, detail="Only PDF files are supported")
     
@@ -80,30 +197,50 @@ async def upload_document(
     upload_dir.mkdir(exist_ok=True)
     
     file_path = upload_dir / file.filename
+    file_size = 0
     with open(file_path, "wb") as buffer:
-        content = await file.read()
-        buffer.write(content)
+        # Stream to disk in chunks rather than holding the whole upload in memory
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            await asyncio.to_thread(buffer.write, chunk)
+            file_size += len(chunk)
     
-    processor = DocumentProcessor()
-    analysis_result = await processor.process_document(str(file_path))
+    analysis_result = await document_processor.process_document(str(file_path), hint=document_type)
     
-    doc = Document(
-        filename=file.filename,
-        filepath=str(file_path),
-        document_type=document_type,
-        analysis_result=json.dumps(analysis_result),
-        file_size=len(content)
-    )
-    db.add(doc)
-    db.commit()
-    db.refresh(doc)
+    return {
+        "filename": file.filename,
+        "filepath": str(file_path),
+        "document_type": document_type,
+        "analysis_result": json_utils.dumps(analysis_result).decode(),
+        "file_size": file_size
+    }
+
+@app.post("/api/documents/upload")
+async def upload_document(
+    file: UploadFile = File(...),
+    document_type: str = "financial",
+    db: Session = Depends(get_db)
+):
+    doc_row = await _ingest_upload(file, document_type)
+    doc = bulk_add_documents(db, [doc_row])[0]
     
     return DocumentResponse.from_orm(doc)
 
-@app.get("/api/documents")
-async def get_documents(db: Session = Depends(get_db)) -> List[DocumentResponse]:
-    documents = db.query(Document).all()
-    return [DocumentResponse.from_orm(doc) for doc in documents]
+@app.get("/api/documents", response_model=List[DocumentResponse])
+async def get_documents(db: Session = Depends(get_db)):
+    result = db.execute(
+        select(
+            Document.id,
+            Document.filename,
+            Document.filepath,
+            Document.document_type,
+            Document.analysis_result,
+            Document.file_size,
+            Document.processed,
+            Document.created_at,
+            Document.updated_at
+        ).execution_options(yield_per=STREAM_BATCH_SIZE)
+    )
+    return StreamingResponse(_stream_json_array(result), media_type="application/json")
 
 @app.delete("/api/documents/{document_id}")
 async def delete_document(document_id: int, db: Session = Depends(get_db)):
@@ -130,15 +267,11 @@ async def chat_with_agent(request: ChatRequest, db: Session = Depends(get_db)):
     if not settings or not settings.llm_api_key:
         raise HTTPException(status_code=400, detail="LLM settings not configured")
     
-    llm_client = LLMClient(
-        provider=settings.llm_provider,
-        api_key=settings.llm_api_key
-    )
-    
     profile_manager = FinanceProfileManager(db)
     context = profile_manager.get_chat_context()
     
-    response = await llm_client.chat_with_context(request.message, context)
+    async with _use_llm_client(settings.llm_provider, settings.llm_api_key) as llm_client:
+        response = await llm_client.chat_with_context(request.message, context)
     
     chat_message = ChatMessage(
         message=request.message,
@@ -152,18 +285,31 @@ async def chat_with_agent(request: ChatRequest, db: Session = Depends(get_db)):
 
 @app.get("/api/chat/history")
 async def get_chat_history(db: Session = Depends(get_db)):
-    messages = db.query(ChatMessage).order_by(ChatMessage.timestamp.desc()).limit(50).all()
-    return [{"message": msg.message, "response": msg.response, "timestamp": msg.timestamp} for msg in messages]
+    result = db.execute(
+        select(ChatMessage.message, ChatMessage.response, ChatMessage.timestamp)
+        .order_by(ChatMessage.timestamp.desc())
+        .limit(50)
+        .execution_options(yield_per=STREAM_BATCH_SIZE)
+    )
+    return StreamingResponse(_stream_json_array(result), media_type="application/json")
 
 frontend_path = Path(__file__).parent.parent / "frontend" / "build"
 if frontend_path.exists():
-    app.mount("/static", StaticFiles(directory=str(frontend_path / "static")), name="static")
+    # Vite writes the hashed bundles to build/assets and references them as /assets/...
+    if (frontend_path / "assets").exists():
+        app.mount("/assets", CompressedStaticFiles(directory=str(frontend_path / "assets")), name="assets")
+    
+    # The build is fixed for the life of the process, so list its files once
+    # instead of stat-ing every requested path
+    FRONTEND_FILES = frozenset(
+        file_path.relative_to(frontend_path).as_posix()
+        for file_path in frontend_path.rglob("*") if file_path.is_file()
+    )
     
     @app.get("/{path:path}")
     async def serve_frontend(path: str):
-        file_path = frontend_path / path
-        if file_path.exists() and file_path.is_file():
-            return FileResponse(file_path)
+        if path in FRONTEND_FILES:
+            return FileResponse(frontend_path / path)
         return FileResponse(frontend_path / "index.html")
 else:
     @app.get("/")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, Float, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, Float, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .database import Base
@@ -27,7 +27,7 @@ class Document(Base):
     analysis_result = Column(Text)
     file_size = Column(Integer)
     processed = Column(Boolean, default=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class FinancialProfile(Base):
@@ -37,13 +37,20 @@ class FinancialProfile(Base):
     category = Column(String, index=True)
     subcategory = Column(String)
     amount = Column(Float)
-    date = Column(DateTime)
+    date = Column(DateTime, index=True)
     description = Column(Text)
     source_document_id = Column(Integer, ForeignKey("documents.id"))
-    metadata = Column(Text)
+    # "metadata" is reserved on declarative classes; keep the column name, rename the attribute
+    extra_metadata = Column("metadata", Text)
+    symbol = Column(String, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     
     source_document = relationship("Document", backref="financial_entries")
+    
+    __table_args__ = (
+        Index("ix_fp_category_date", "category", "date"),
+        Index("ix_fp_category_amount", "category", "amount"),
+    )
 
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
@@ -51,7 +58,7 @@ class ChatMessage(Base):
     id = Column(Integer, primary_key=True, index=True)
     message = Column(Text)
     response = Column(Text)
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
     context_used = Column(Text)
 
 class RAGDocument(Base):
@@ -63,5 +70,7 @@ class RAGDocument(Base):
     content = Column(Text)
     embedding_id = Column(String)
     chunk_count = Column(Integer, default=0)
+    # JSON of the document-level metadata its chunks carry in Chroma
+    document_metadata = Column(Text)
     processed = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
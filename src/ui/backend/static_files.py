@@ -0,0 +1,72 @@
+import stat
+from mimetypes import guess_type
+
+import anyio
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.types import Scope
+
+# Build assets carry content hashes in their names, so they never change in place
+STATIC_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Precompressed siblings written at build time, in order of preference
+PRECOMPRESSED_ENCODINGS = (("br", ".br"), ("zstd", ".zst"))
+
+def accepted_encodings(accept_encoding: str) -> set:
+    """
+    Content codings the client accepts, honouring q-values (q=0 means refused)
+    """
+    qualities = {}
+    for token in accept_encoding.split(","):
+        coding, *params = [part.strip() for part in token.split(";")]
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.lower()] = quality
+    
+    wildcard = qualities.pop("*", 0.0)
+    accepted = {coding for coding, quality in qualities.items() if quality > 0}
+    if wildcard > 0:
+        # "*" covers every coding not listed explicitly
+        accepted |= {coding for coding, _ in PRECOMPRESSED_ENCODINGS if coding not in qualities}
+    return accepted
+
+class CompressedStaticFiles(StaticFiles):
+    """
+    StaticFiles that serves a precompressed <path>.br / <path>.zst when the
+    client accepts it, and marks every asset as long-lived
+    """
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        accepted = accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        
+        response = None
+        for encoding, suffix in PRECOMPRESSED_ENCODINGS:
+            if encoding not in accepted:
+                continue
+            full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, path + suffix)
+            if stat_result and stat.S_ISREG(stat_result.st_mode):
+                response = FileResponse(
+                    full_path,
+                    stat_result=stat_result,
+                    media_type=guess_type(path)[0] or "text/plain",
+                    headers={"Content-Encoding": encoding}
+                )
+                break
+        
+        if response is None:
+            response = await super().get_response(path, scope)
+        
+        # The uncompressed variant depends on Accept-Encoding too, so caches
+        # must not hand it to clients that could have had br or zstd
+        response.headers["Vary"] = "Accept-Encoding"
+        if response.status_code in (200, 304):
+            response.headers["Cache-Control"] = STATIC_CACHE_CONTROL
+        return response